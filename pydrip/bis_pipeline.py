@@ -1,11 +1,15 @@
 """Methods to get dam removal data into bis pipeline."""
 
 # Import needed packages
+import asyncio
+import functools
 import pandas as pd
 
+from . import drip_checkpoint
 from . import drip_dam
 from . import drip_sources
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Export Dam Removal Science Tables needed for DRIP
@@ -17,15 +21,27 @@ tables = ["DamCitations",
           "Citation",
           "dam removal science"]
 
+# Science database column groups read by build_drip_dams_table,
+# see drip_sources.science_column_groups
+dams_table_column_groups = ["Dam", "Accession"]
+
 json_schema = None
 
 
-def get_data():
+def get_data(categorical=False, groups=None):
     """Retrieve source data.
 
     Retrieves source data from American Rivers Dam Removal Database
     and USGS Dam Removal Science Database.
 
+    Parameters
+    ----------
+    categorical: bool
+        If True keep repetitive text columns as categoricals
+    groups: list
+        science database column groups to read, None reads all
+        columns, e.g. dams_table_column_groups
+
     Returns
     ----------
     american_rivers_df: pandas dataframe
@@ -36,13 +52,94 @@ def get_data():
     """
     # get latest American Rivers Data
     ar_url = drip_sources.get_american_rivers_data_url()
-    american_rivers_df = drip_sources.read_american_rivers(ar_url)
+    american_rivers_df = drip_sources.read_american_rivers(
+        ar_url, categorical=categorical
+    )
 
     # get latest Dam Removal Science Data
     drd_url = drip_sources.get_science_data_url()
-    dam_removal_science_df = drip_sources.read_science_data(drd_url)
+    dam_removal_science_df = drip_sources.read_science_data(
+        drd_url, categorical=categorical, groups=groups
+    )
+
+    source_datasets = get_source_datasets(ar_url, drd_url)
+
+    return american_rivers_df, dam_removal_science_df, source_datasets
+
+
+async def get_data_async(
+    executor=None, categorical=False, store=None, ar_url=None, drd_url=None,
+    groups=None,
+):
+    """Retrieve source data without blocking the event loop.
 
-    # source data
+    Same as get_data, but both sources are looked up and downloaded
+    concurrently in executor threads.
+
+    Parameters
+    ----------
+    executor: concurrent.futures.Executor
+        executor used for blocking calls, None uses loop default
+    categorical: bool
+        If True keep repetitive text columns as categoricals
+    store: drip_checkpoint.CheckpointStore
+        if given, downloads and parsed dataframes are checkpointed
+    ar_url: str
+        pinned url or local path of American Rivers data,
+        newest version is looked up when None
+    drd_url: str
+        pinned url or local path of Dam Removal Science data,
+        newest version is looked up when None
+    groups: list
+        science database column groups to read, None reads all columns
+
+    Returns
+    ----------
+    american_rivers_df: pandas dataframe
+        American Rivers database in pandas dataframe
+    dam_removal_science_df: pandas dataframe
+        USGS Dam Removal Science database in pandas dataframe
+
+    """
+    loop = asyncio.get_event_loop()
+
+    async def fetch(url, get_url, read):
+        if url is None:
+            url = await loop.run_in_executor(executor, get_url)
+        if store is None:
+            df = await loop.run_in_executor(executor, read, url)
+            return url, df
+
+        path, digest = await loop.run_in_executor(
+            executor, store.get_source, url
+        )
+        df = await loop.run_in_executor(
+            executor, store.cached, "parsed",
+            drip_checkpoint.fingerprint(digest, read.func.__name__,
+                                        sorted(read.keywords.items())),
+            functools.partial(read, path),
+        )
+        return url, df
+
+    (ar_url, american_rivers_df), (drd_url, dam_removal_science_df) = (
+        await asyncio.gather(
+            fetch(ar_url, drip_sources.get_american_rivers_data_url,
+                  functools.partial(drip_sources.read_american_rivers,
+                                    categorical=categorical)),
+            fetch(drd_url, drip_sources.get_science_data_url,
+                  functools.partial(drip_sources.read_science_data,
+                                    categorical=categorical,
+                                    groups=groups)),
+        )
+    )
+
+    source_datasets = get_source_datasets(ar_url, drd_url)
+
+    return american_rivers_df, dam_removal_science_df, source_datasets
+
+
+def get_source_datasets(ar_url, drd_url):
+    """Describe source datasets downloaded today."""
     today = datetime.today().strftime('%Y-%m-%d')
     source_datasets = [{"source": "american rivers dam removal database",
                         "data_download_url": ar_url,
@@ -51,17 +148,23 @@ def get_data():
                         "data_download_url": drd_url,
                         "data_accessed": today}
                        ]
-
-    return american_rivers_df, dam_removal_science_df, source_datasets
+    return source_datasets
 
 
-def build_drip_dams_table(dam_removal_science_df, american_rivers_df):
+def build_drip_dams_table(
+    dam_removal_science_df, american_rivers_df, categorical=False
+):
     """Build all needed tables of information.
 
     Builds table of all dam removals from both USGS and
     American Rivers sources. This dataset represents dams
     shown in the Dam Removal Science Database.
 
+    Parameters
+    ----------
+    categorical: bool
+        If True keep drip_sources.dam_categorical_columns as categoricals
+
     """
     # Select fields that contain dam information or american rivers id
     dam_science_df = drip_sources.get_science_subset(
@@ -73,10 +176,15 @@ def build_drip_dams_table(dam_removal_science_df, american_rivers_df):
         dam_removal_science_df, target="Accession"
     )
 
+    # Cast dam fields once for all dams
+    coerced_dam_science_df = drip_sources.coerce_science_dam_data(
+        dam_science_df
+    )
+
     # For each dam in science database find best available data for the dam
     # First looking in science database and if null look in American Rivers
     all_dam_info = []
-    for dam in dam_science_df.itertuples():
+    for dam in coerced_dam_science_df.itertuples():
         removal_data = drip_dam.Dam(dam_id=dam.science_dam_id)
         removal_data.science_data(dam)
         removal_data.update_missing_data(american_rivers_df)
@@ -84,21 +192,22 @@ def build_drip_dams_table(dam_removal_science_df, american_rivers_df):
         removal_data.add_science_summaries(science_accession_df)
         all_dam_info.append(removal_data.__dict__)
 
-    # For each dam only in American Rivers database, get AR data
+    # For dams only in American Rivers database, get AR data
     ar_only_dams = drip_sources.get_ar_only_dams(american_rivers_df, dam_science_df)
-    for dam in ar_only_dams.itertuples():
-        removal_data = drip_dam.Dam(
-            dam_id=dam.AR_ID, dam_source="American Rivers"
-        )
-        removal_data.ar_dam_data(dam)
-        removal_data.add_geometry()
-        all_dam_info.append(removal_data.__dict__)
+    ar_dam_df = drip_dam.build_ar_dams_table(ar_only_dams)
 
-    all_dam_df = pd.DataFrame(all_dam_info)
+    all_dam_df = pd.concat(
+        [pd.DataFrame(all_dam_info), ar_dam_df], ignore_index=True, sort=False
+    )
 
     # select only records with geometery
     all_spatial_dam_df = all_dam_df[all_dam_df["geometry"].notna()]
 
+    if categorical:
+        all_spatial_dam_df = drip_sources.encode_categories(
+            all_spatial_dam_df, drip_sources.dam_categorical_columns
+        )
+
     # Create GeoDataFrame, set crs
     # dams_gdf = gpd.GeoDataFrame(df, geometry=df['geometry'])
     # dams_gdf.crs = {'init':'epsg:4326'}
@@ -106,6 +215,34 @@ def build_drip_dams_table(dam_removal_science_df, american_rivers_df):
     return all_spatial_dam_df
 
 
+def table_records(df, table):
+    """Build pipeline records for each row of a table.
+
+    Parameters
+    ----------
+    df: pandas dataframe
+        table to convert
+    table: str
+        dataset name, 'dam_removals' rows are keyed by dam _id
+        and all other tables by index
+
+    Returns
+    ----------
+    records: list
+        dicts in format {'row_id': <row_id>, 'data': <json_data>}
+
+    """
+    records = []
+    for index, record in df.iterrows():
+        record.loc["dataset"] = table
+        if table == "dam_removals":
+            row_id = "dam_removals_" + record["_id"]
+        else:
+            row_id = f"{table}_{index}"
+        records.append({"row_id": row_id, "data": record.to_dict()})
+    return records
+
+
 def process_1(
     path, ch_ledger, send_final_result, send_to_stage, previous_stage_result,
 ):
@@ -114,40 +251,201 @@ def process_1(
     Architecture and process is based on the pipeline documentation here:
     https://code.chs.usgs.gov/fort/bcb/pipeline/docs
 
+    This is a synchronous wrapper of process_1_async.  Records are
+    sent one at a time, in order, to send_final_result.  When called
+    from a thread that is already running an event loop, the process
+    runs on a separate thread with its own loop.
+
+    previous_stage_result may be {'checkpoint_dir': <path>} to keep
+    stage checkpoints there and resume an earlier failed run,
+    see process_1_async.
+
     """
-    # Get american rivers and dam removal science data into dataframes
-    american_rivers_df, dam_removal_science_df, source_datasets = get_data()
+    async def send(record):
+        send_final_result(record)
+
+    def run():
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(process_1_async(
+                path, ch_ledger, send, send_to_stage, previous_stage_result,
+                max_concurrency=1,
+            ))
+        finally:
+            loop.close()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return run()
+
+    # the calling thread already runs an event loop (e.g. Jupyter),
+    # so run on a thread of its own and block until it finishes
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run).result()
+
+
+async def process_1_async(
+    path, ch_ledger, send_final_result, send_to_stage, previous_stage_result,
+    max_concurrency=10, executor=None, categorical=False,
+    ar_url=None, drd_url=None,
+):
+    """Pipeline process for use on a running event loop.
+
+    Source downloads and table building run in executor threads.
+    Tables are built one after another while records of previously
+    built tables are being sent, so emission overlaps with building.
 
-    # Build JSON Representation of Drip Dams
-    all_spatial_dam_df = build_drip_dams_table(
-        dam_removal_science_df, american_rivers_df
+    When previous_stage_result holds a checkpoint directory (see
+    drip_checkpoint.get_checkpoint_dir) downloads, parsed sources,
+    the dams table and each subset table are checkpointed there, as is
+    the number of records acknowledged by send_final_result.  Running
+    again with the same directory skips completed stages and continues
+    sending after the last acknowledged record.
+
+    Parameters
+    ----------
+    previous_stage_result: dict or str or None
+        resume token, {'checkpoint_dir': <path>}
+    send_final_result: coroutine function
+        awaited once per record
+    max_concurrency: int
+        maximum number of send_final_result calls awaited at once
+    executor: concurrent.futures.Executor
+        executor used for downloads and table building,
+        None uses loop default
+    categorical: bool
+        If True keep repetitive text columns as categoricals while
+        building, emitted records always hold plain values
+    ar_url, drd_url: str
+        pinned source urls or local paths, see get_data_async
+
+    Returns
+    ----------
+    record_count: int
+        number of records of the run, including records acknowledged
+        in earlier attempts
+
+    """
+    loop = asyncio.get_event_loop()
+
+    store = None
+    checkpoint_dir = drip_checkpoint.get_checkpoint_dir(previous_stage_result)
+    if checkpoint_dir is not None:
+        store = drip_checkpoint.CheckpointStore(checkpoint_dir)
+
+    # Get american rivers and dam removal science data into dataframes
+    american_rivers_df, dam_removal_science_df, source_datasets = (
+        await get_data_async(executor, categorical=categorical, store=store,
+                             ar_url=ar_url, drd_url=drd_url)
     )
 
-    record_count = 0
-    for _index, dam in all_spatial_dam_df.iterrows():
-        dam.loc["dataset"] = "dam_removals"
-        row_id = "dam_removals_" + dam["_id"]
-        data = {"row_id": row_id, "data": dam.to_dict()}
-        send_final_result(data)
-        record_count += 1
-
-    for table in tables:
-        df = drip_sources.get_science_subset(dam_removal_science_df, table)
-
-        for index, record in df.iterrows():
-            record.loc["dataset"] = table
-            row_id = f"{table}_{index}"
-            data = {"row_id": row_id, "data": record.to_dict()}
-            send_final_result(data)
-            record_count += 1
+    ledger = None
+    if store is not None:
+        run_key = drip_checkpoint.fingerprint(
+            store.source_digests[source_datasets[0]["data_download_url"]],
+            store.source_digests[source_datasets[1]["data_download_url"]],
+            categorical,
+        )
+        ledger = drip_checkpoint.EmissionLedger(store, run_key)
+
+    async def build_table(stage, build, *args):
+        if store is None:
+            return await loop.run_in_executor(executor, build, *args)
+        return await loop.run_in_executor(
+            executor, store.cached, stage, run_key,
+            functools.partial(build, *args),
+        )
 
-    df = pd.DataFrame(source_datasets)
-    table = "source_datasets"
-    for index, record in df.iterrows():
-        record.loc["dataset"] = table
-        row_id = f"{table}_{index}"
-        data = {"row_id": row_id, "data": record.to_dict()}
-        send_final_result(data)
-        record_count += 1
+    # Tables of records are built in order and handed to the sender
+    built = asyncio.Queue(maxsize=2)
+
+    async def build():
+        # Build JSON Representation of Drip Dams
+        all_spatial_dam_df = await build_table(
+            "dams_table", build_drip_dams_table,
+            dam_removal_science_df, american_rivers_df, categorical,
+        )
+        await built.put(await loop.run_in_executor(
+            executor, table_records, all_spatial_dam_df, "dam_removals"
+        ))
+
+        for table in tables:
+            df = await build_table(
+                f"subset_{table}", drip_sources.get_science_subset,
+                dam_removal_science_df, table,
+            )
+            await built.put(await loop.run_in_executor(
+                executor, table_records, df, table
+            ))
+
+        df = pd.DataFrame(source_datasets)
+        await built.put(table_records(df, "source_datasets"))
+        await built.put(None)
+
+    builder = asyncio.ensure_future(build())
+
+    async def next_table():
+        # wait on builder too, so a failed build is raised here
+        # instead of leaving the queue empty forever
+        getter = asyncio.ensure_future(built.get())
+        done, _pending = await asyncio.wait(
+            {getter, builder}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if getter in done:
+            return getter.result()
+        if builder.exception() is not None:
+            getter.cancel()
+            raise builder.exception()
+        return await getter
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    pending = set()
+    errors = []
+
+    def sent(position, task):
+        pending.discard(task)
+        semaphore.release()
+        if not task.cancelled() and task.exception() is not None:
+            errors.append(task.exception())
+        elif ledger is not None and not task.cancelled():
+            ledger.ack(position)
+
+    # records before offset were acknowledged in an earlier attempt
+    offset = 0 if ledger is None else ledger.offset
+
+    record_count = 0
+    try:
+        while True:
+            records = await next_table()
+            if records is None:
+                break
+            for record in records:
+                position = record_count
+                record_count += 1
+                if position < offset:
+                    continue
+                await semaphore.acquire()
+                if errors:
+                    semaphore.release()
+                    raise errors[0]
+                task = asyncio.ensure_future(send_final_result(record))
+                pending.add(task)
+                task.add_done_callback(functools.partial(sent, position))
+
+        await builder
+        if pending:
+            await asyncio.wait(pending)
+        if errors:
+            raise errors[0]
+        if ledger is not None:
+            ledger.complete()
+            ledger = None
+    finally:
+        builder.cancel()
+        for task in pending:
+            task.cancel()
+        if ledger is not None:
+            ledger.save()
 
     return record_count
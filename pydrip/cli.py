@@ -0,0 +1,438 @@
+"""Command line runner for the DRIP pipeline.
+
+Runs the pipeline steps without the BIS pipeline infrastructure, so
+slow runs can be reproduced and profiled locally.
+
+Usage
+----------
+pydrip fetch --out-dir sources
+pydrip build --ar-file sources/american_rivers.csv
+             --science-file sources/dam_removal_science.csv --out-dir out
+pydrip export --out-dir out
+pydrip benchmark --repeat 3
+
+Every command accepts --profile <path> to write a profile of the run.
+With --profiler sample (default) all threads are sampled and stacks are
+written in collapsed format (one 'frame;frame;frame count' line per
+stack), which flamegraph.pl and speedscope read directly.  With
+--profiler cprofile the run is profiled with cProfile and stats are
+written for pstats or snakeviz.  cProfile only sees the main thread, so
+downloads and table building then run inline on the main thread instead
+of in --workers threads.
+"""
+
+# Import packages
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+import pandas as pd
+
+from . import bis_pipeline
+from . import drip_citations
+from . import drip_quality
+from . import drip_sources
+from . import drip_summary
+from . import drip_tiles
+
+source_files = {"american_rivers": "american_rivers.csv",
+                "science": "dam_removal_science.csv"}
+
+
+class StackSampler:
+    """Sample stacks of all running threads at a fixed interval."""
+
+    def __init__(self, interval=0.005):
+        """Initiate sampler.
+
+        Parameters
+        ----------
+        interval: float
+            seconds between samples
+
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start sampling in a background thread."""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} "
+                        f"({os.path.basename(code.co_filename)}:"
+                        f"{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def write(self, path):
+        """Write sampled stacks in collapsed format."""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class InlineExecutor(Executor):
+    """Executor running each call right away in the calling thread."""
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn and return its finished future."""
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+def get_executor(args):
+    """Get executor for downloads and table building.
+
+    A pool of --workers threads, or an InlineExecutor when profiling
+    with cProfile, which only profiles the main thread.
+    """
+    if args.profile and args.profiler == "cprofile":
+        return InlineExecutor()
+    return ThreadPoolExecutor(max_workers=args.workers)
+
+
+def get_sources(args):
+    """Get pinned american rivers and science sources from arguments."""
+    ar_url = args.ar_file or args.ar_url
+    drd_url = args.science_file or args.science_url
+    return ar_url, drd_url
+
+
+def get_data(args, groups=None):
+    """Read source data as selected by arguments, see get_sources.
+
+    groups selects the science database column groups to read,
+    None reads all columns.
+    """
+    ar_url, drd_url = get_sources(args)
+    loop = asyncio.new_event_loop()
+    try:
+        with get_executor(args) as executor:
+            return loop.run_until_complete(bis_pipeline.get_data_async(
+                executor, categorical=args.categorical,
+                ar_url=ar_url, drd_url=drd_url, groups=groups,
+            ))
+    finally:
+        loop.close()
+
+
+def write_table(df, name, out_dir, output_format):
+    """Write table to out_dir as csv or json records."""
+    path = os.path.join(out_dir, f"{name}.{output_format}")
+    if output_format == "csv":
+        df.to_csv(path, sep=",", index=False)
+    else:
+        df.to_json(path, orient="records")
+    return path
+
+
+def fetch(args):
+    """Download source files to out_dir."""
+    ar_url, drd_url = get_sources(args)
+    with get_executor(args) as executor:
+        ar_url, drd_url = executor.map(
+            lambda url_lookup: url_lookup[0] or url_lookup[1](),
+            [(ar_url, drip_sources.get_american_rivers_data_url),
+             (drd_url, drip_sources.get_science_data_url)],
+        )
+        contents = executor.map(
+            drip_sources.get_source_content, [ar_url, drd_url]
+        )
+        for name, content in zip(
+            ["american_rivers", "science"], contents
+        ):
+            path = os.path.join(args.out_dir, source_files[name])
+            with open(path, "wb") as f:
+                f.write(content)
+            print(f"Wrote {path}")
+
+    path = os.path.join(args.out_dir, "source_datasets.json")
+    with open(path, "w") as f:
+        json.dump(bis_pipeline.get_source_datasets(ar_url, drd_url), f,
+                  indent=2)
+    print(f"Wrote {path}")
+
+
+def build(args):
+    """Run the pipeline with a local sink writing one table per dataset."""
+    ar_url, drd_url = get_sources(args)
+    collected_data = {}
+
+    # Is in format {'row_id': <row_id>, 'data', <json_data>}
+    async def send_final_result(record):
+        data = record['data']
+        collected_data.setdefault(data['dataset'], []).append(data)
+
+    previous_stage_result = None
+    if args.checkpoint_dir:
+        previous_stage_result = {"checkpoint_dir": args.checkpoint_dir}
+
+    loop = asyncio.new_event_loop()
+    try:
+        with get_executor(args) as executor:
+            record_count = loop.run_until_complete(
+                bis_pipeline.process_1_async(
+                    "cli", None, send_final_result, None,
+                    previous_stage_result, executor=executor,
+                    categorical=args.categorical,
+                    ar_url=ar_url, drd_url=drd_url,
+                )
+            )
+    finally:
+        loop.close()
+
+    for table, records in collected_data.items():
+        path = write_table(
+            pd.DataFrame(records), table, args.out_dir, args.format
+        )
+        print(f"Wrote {path}")
+    print("Records processed: ", record_count)
+
+
+def export(args):
+    """Write map tiles, citation lookup, summary cube and quality report."""
+    # only read science columns needed by the dams table and citations
+    groups = bis_pipeline.dams_table_column_groups + [
+        group for group in drip_citations.citation_column_groups
+        if group not in bis_pipeline.dams_table_column_groups
+    ]
+    american_rivers_df, dam_removal_science_df, _source_datasets = (
+        get_data(args, groups)
+    )
+    dams_df = bis_pipeline.build_drip_dams_table(
+        dam_removal_science_df, american_rivers_df, args.categorical
+    )
+
+    summary = drip_tiles.export_tiles(
+        dams_df, os.path.join(args.out_dir, "tiles"), zooms=args.zooms
+    )
+    print(f"Tiles written: {len(summary['written'])}, "
+          f"deleted: {len(summary['deleted'])}, "
+          f"unchanged: {summary['unchanged']}")
+
+    path = os.path.join(args.out_dir, "dam_citations.json.gz")
+    drip_citations.DamCitationIndex.build(dam_removal_science_df).save(path)
+    print(f"Wrote {path}")
+
+    dam_science_df = drip_sources.get_science_subset(
+        dam_removal_science_df, "Dam"
+    )
+    accession_df = drip_sources.get_science_subset(
+        dam_removal_science_df, "Accession"
+    )
+    states = drip_summary.get_dam_states(
+        dams_df, dam_science_df, american_rivers_df
+    )
+    facts = drip_summary.build_facts(dams_df, accession_df, states)
+    summary_dir = os.path.join(args.out_dir, "summary")
+    if os.path.exists(os.path.join(summary_dir, "summary_facts.csv")):
+        # only re-aggregate dams changed since the last export
+        cube = drip_summary.SummaryCube.load(summary_dir)
+        changes = cube.update(facts)
+        print(f"Summary dams added: {len(changes['added'])}, "
+              f"removed: {len(changes['removed'])}, "
+              f"changed: {len(changes['changed'])}")
+    else:
+        cube = drip_summary.SummaryCube(facts)
+    cube.save(summary_dir)
+    print(f"Wrote {summary_dir}")
+
+    report = drip_quality.evaluate_rules(
+        dams_df, american_rivers_df=american_rivers_df
+    )
+    path = write_table(report, "quality_report", args.out_dir, "csv")
+    print(f"Wrote {path}, {len(report)} flagged records")
+
+
+def benchmark(args):
+    """Time each pipeline stage over repeated runs."""
+    ar_url, drd_url = get_sources(args)
+    if ar_url is None:
+        ar_url = drip_sources.get_american_rivers_data_url()
+    if drd_url is None:
+        drd_url = drip_sources.get_science_data_url()
+
+    timings = []
+
+    def timed(stage, function, *function_args, **kwargs):
+        start = time.perf_counter()
+        result = function(*function_args, **kwargs)
+        timings.append({"stage": stage,
+                        "seconds": time.perf_counter() - start})
+        return result
+
+    for _run in range(args.repeat):
+        american_rivers_df = timed(
+            "read_american_rivers", drip_sources.read_american_rivers,
+            ar_url, categorical=args.categorical,
+        )
+        dam_removal_science_df = timed(
+            "read_science_data", drip_sources.read_science_data,
+            drd_url, categorical=args.categorical,
+        )
+        dams_df = timed(
+            "build_drip_dams_table", bis_pipeline.build_drip_dams_table,
+            dam_removal_science_df, american_rivers_df, args.categorical,
+        )
+        timed("table_records dam_removals", bis_pipeline.table_records,
+              dams_df, "dam_removals")
+        for table in bis_pipeline.tables:
+            df = timed(f"get_science_subset {table}",
+                       drip_sources.get_science_subset,
+                       dam_removal_science_df, table)
+            timed(f"table_records {table}", bis_pipeline.table_records,
+                  df, table)
+        with drip_sources.ScienceSource(drd_url) as science_source:
+            timed("read_science_data dams table", science_source.read,
+                  bis_pipeline.dams_table_column_groups,
+                  categorical=args.categorical)
+            for table in bis_pipeline.tables:
+                timed(f"read_science_subset {table}",
+                      science_source.read_subset,
+                      table, categorical=args.categorical)
+
+    report = pd.DataFrame(timings).groupby("stage", sort=False)[
+        "seconds"
+    ].agg(["min", "mean", "max"])
+    print(report.to_string(float_format="{:.4f}".format))
+    if args.out_dir:
+        path = os.path.join(args.out_dir, "benchmark.csv")
+        report.to_csv(path)
+        print(f"Wrote {path}")
+
+
+def get_parser():
+    """Build argument parser of the pydrip command."""
+    common = argparse.ArgumentParser(add_help=False)
+    sources = common.add_argument_group("sources")
+    ar_source = sources.add_mutually_exclusive_group()
+    ar_source.add_argument(
+        "--ar-url", help="pin American Rivers download url "
+        "(default: newest version from Figshare)")
+    ar_source.add_argument(
+        "--ar-file", help="local American Rivers CSV file")
+    science_source = sources.add_mutually_exclusive_group()
+    science_source.add_argument(
+        "--science-url", help="pin Dam Removal Science download url "
+        "(default: newest version from DOI)")
+    science_source.add_argument(
+        "--science-file", help="local Dam Removal Science CSV file")
+    common.add_argument(
+        "--workers", type=int, default=4,
+        help="threads used for source downloads and table building, "
+        "tables are built one at a time while records are sent "
+        "(default: 4)")
+    common.add_argument(
+        "--categorical", action="store_true",
+        help="keep repetitive text columns as categoricals")
+    common.add_argument(
+        "--profile", metavar="PATH", help="write profile of the run to PATH")
+    common.add_argument(
+        "--profiler", choices=["sample", "cprofile"], default="sample",
+        help="sample: collapsed stacks of all threads for flame graphs, "
+        "cprofile: cProfile stats, stages run inline on the main thread "
+        "(default: sample)")
+
+    parser = argparse.ArgumentParser(
+        prog="pydrip", description="Build data for the Dam Removal "
+        "Information Portal (DRIP).")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    command = commands.add_parser(
+        "fetch", parents=[common], help="download source files")
+    command.add_argument("--out-dir", default=".")
+    command.set_defaults(run=fetch)
+
+    command = commands.add_parser(
+        "build", parents=[common],
+        help="build dam removals and science tables")
+    command.add_argument("--out-dir", default=".")
+    command.add_argument("--format", choices=["csv", "json"], default="csv")
+    command.add_argument(
+        "--checkpoint-dir",
+        help="keep stage checkpoints here and resume failed runs")
+    command.set_defaults(run=build)
+
+    command = commands.add_parser(
+        "export", parents=[common],
+        help="write map tiles, citation lookup, summary cube and "
+        "quality report")
+    command.add_argument("--out-dir", default=".")
+    command.add_argument(
+        "--zooms", type=int, nargs="+", default=drip_tiles.default_zooms,
+        help="tile zoom levels")
+    command.set_defaults(run=export)
+
+    command = commands.add_parser(
+        "benchmark", parents=[common], help="time each pipeline stage")
+    command.add_argument("--repeat", type=int, default=3)
+    command.add_argument("--out-dir", help="also write benchmark.csv here")
+    command.set_defaults(run=benchmark)
+
+    return parser
+
+
+def main(argv=None):
+    """Run pydrip command."""
+    args = get_parser().parse_args(argv)
+    if getattr(args, "out_dir", None):
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    if not args.profile:
+        args.run(args)
+        return 0
+
+    if args.profiler == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            args.run(args)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+    else:
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            args.run(args)
+        finally:
+            sampler.stop()
+            sampler.write(args.profile)
+    print(f"Wrote profile {args.profile}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""Checkpoints for resuming DRIP pipeline runs.
+
+A pipeline run downloads both sources, parses them, builds the dams
+table and each science subset, then sends every record.  This module
+keeps the result of each of those stages in a local work directory,
+keyed by fingerprints of the stage inputs, along with the number of
+records already acknowledged.  A rerun with the same work directory
+skips completed stages and continues sending after the last
+acknowledged record.
+
+Notes
+----------
+Source downloads are keyed by url and source version (see
+drip_sources.get_source_version) and all later stages by the content
+digest of the downloaded sources, so a changed source file is downloaded
+again and starts a new set of checkpoints.  When a url has no known
+version it is downloaded on every run and keyed by its content digest.
+All keys include the pydrip version, so checkpoints of an older pydrip
+are never reused.  Files are written to a temporary name and moved into
+place, so an interrupted write never leaves a partial checkpoint.
+"""
+
+# Import packages
+import hashlib
+import json
+import os
+import pickle
+
+from . import __version__ as pydrip_version
+from . import drip_sources
+
+
+def fingerprint(*parts):
+    """Build a hex digest identifying a combination of inputs.
+
+    The pydrip version is always included.
+    """
+    digest = hashlib.sha1()
+    digest.update(repr(pydrip_version).encode("utf-8"))
+    digest.update(b"\0")
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get_checkpoint_dir(previous_stage_result):
+    """Get work directory from a pipeline resume token.
+
+    Parameters
+    ----------
+    previous_stage_result: dict or str or None
+        {'checkpoint_dir': <path>} or a path, as passed to process_1
+
+    Returns
+    ----------
+    checkpoint_dir: str or None
+        None when checkpoints are not requested
+    """
+    if isinstance(previous_stage_result, dict):
+        return previous_stage_result.get("checkpoint_dir")
+    if isinstance(previous_stage_result, str):
+        return previous_stage_result
+    return None
+
+
+class CheckpointStore:
+    """Stage results of pipeline runs kept in a work directory."""
+
+    def __init__(self, work_dir):
+        """Initiate store.
+
+        Parameters
+        ----------
+        work_dir: str
+            directory holding checkpoints, created if missing
+
+        """
+        self.work_dir = work_dir
+        self.source_digests = {}
+        os.makedirs(work_dir, exist_ok=True)
+
+    def path(self, stage, key, suffix):
+        """Path of the checkpoint of a stage for an input key."""
+        return os.path.join(self.work_dir, f"{stage}-{key}{suffix}")
+
+    def _write(self, path, content, mode="wb"):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, mode) as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def get_source(self, file_url):
+        """Download a version of a source file once.
+
+        Urls without a known version (see
+        drip_sources.get_source_version) are downloaded every time and
+        the stored copy is reused only when the content is unchanged.
+
+        Parameters
+        ----------
+        file_url: str
+            Url of source file
+
+        Returns
+        ----------
+        path: str
+            local copy of source file
+        digest: str
+            sha1 of source file content
+        """
+        content = None
+        version = drip_sources.get_source_version(file_url)
+        if version is None:
+            # unknown version, the content tells versions apart
+            content = drip_sources.get_source_content(file_url)
+            version = hashlib.sha1(content).hexdigest()
+
+        key = fingerprint(file_url, version)
+        path = self.path("source", key, ".raw")
+        meta_path = self.path("source", key, ".json")
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                digest = json.load(f)["digest"]
+        else:
+            if content is None:
+                content = drip_sources.get_source_content(file_url)
+            digest = hashlib.sha1(content).hexdigest()
+            self._write(path, content)
+            self._write(
+                meta_path,
+                json.dumps({"url": file_url, "digest": digest}),
+                mode="w",
+            )
+        self.source_digests[file_url] = digest
+        return path, digest
+
+    def cached(self, stage, key, build):
+        """Get result of a stage, building it only when not checkpointed.
+
+        Parameters
+        ----------
+        stage: str
+            name of stage
+        key: str
+            fingerprint of stage inputs
+        build: callable
+            called without arguments to build the result
+
+        Returns
+        ----------
+        result: object
+            checkpointed or newly built result
+        """
+        path = self.path(stage, key, ".pkl")
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return pickle.load(f)
+
+        result = build()
+        self._write(path, pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+        return result
+
+    def load_offset(self, run_key):
+        """Get number of records acknowledged in a run, 0 if none."""
+        path = self.path("emission", run_key, ".json")
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return json.load(f)["offset"]
+
+    def save_offset(self, run_key, offset):
+        """Record number of records acknowledged in a run."""
+        self._write(
+            self.path("emission", run_key, ".json"),
+            json.dumps({"offset": offset}),
+            mode="w",
+        )
+
+    def clear_offset(self, run_key):
+        """Forget emission progress of a completed run."""
+        path = self.path("emission", run_key, ".json")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class EmissionLedger:
+    """Track which records of a run were acknowledged.
+
+    Records are numbered in sending order.  With concurrent sends
+    acknowledgements arrive out of order, so the offset only moves
+    past records once every earlier record is acknowledged.
+    """
+
+    def __init__(self, store, run_key, save_every=100):
+        """Initiate ledger at the saved offset of a run.
+
+        Parameters
+        ----------
+        store: CheckpointStore
+            store holding the offset
+        run_key: str
+            fingerprint of run inputs
+        save_every: int
+            save offset after this many acknowledgements
+
+        """
+        self.store = store
+        self.run_key = run_key
+        self.save_every = save_every
+        self.offset = store.load_offset(run_key)
+        self._saved_offset = self.offset
+        self._acknowledged = set()
+
+    def ack(self, position):
+        """Mark record at position as acknowledged."""
+        self._acknowledged.add(position)
+        while self.offset in self._acknowledged:
+            self._acknowledged.remove(self.offset)
+            self.offset += 1
+        if self.offset - self._saved_offset >= self.save_every:
+            self.save()
+
+    def save(self):
+        """Save current offset."""
+        self.store.save_offset(self.run_key, self.offset)
+        self._saved_offset = self.offset
+
+    def complete(self):
+        """Forget offset once all records were sent."""
+        self.store.clear_offset(self.run_key)
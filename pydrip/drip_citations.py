@@ -0,0 +1,182 @@
+"""Per dam citation lookup for the Dam Removal Information Portal.
+
+The dam detail view of DRIP lists the citations of each dam.  This
+module builds, once per source version, an aggregate of dam id to the
+ordered citations of that dam from the flattened USGS Dam Removal
+Science Database, stores it as gzipped JSON and serves lookups from a
+dictionary.
+
+Notes
+----------
+Citation text and DOI urls are built the same way as
+drip_sources.get_science_subset(target='DamCitations').
+"""
+
+# Import packages
+import gzip
+import json
+from collections import namedtuple
+
+import pandas as pd
+
+from . import drip_sources
+
+# Science database column groups read by DamCitationIndex.build,
+# see drip_sources.science_column_groups
+citation_column_groups = ["Citation", "Accession"]
+
+DamCitation = namedtuple(
+    "DamCitation",
+    ["citation", "doi", "year", "science_citation_id", "science_results_ids"],
+)
+
+
+class DamCitationIndex:
+    """Ordered citations per dam with constant time lookup."""
+
+    def __init__(self, citations_by_dam):
+        """Initiate index.
+
+        Parameters
+        ----------
+        citations_by_dam: dict
+            dam id (str) to list of DamCitation, see build()
+
+        """
+        self._citations = citations_by_dam
+
+    @classmethod
+    def build(cls, science_df):
+        """Build index from the Dam Removal Science Database.
+
+        Parameters
+        ----------
+        science_df: pandas dataframe
+            Return dataframe from drip_sources.read_science_data
+
+        Returns
+        ----------
+        index: DamCitationIndex
+            citations of each dam ordered by year then citation
+        """
+        df = drip_sources.drop_duplicate_rows(science_df[[
+            "science_dam_id", "science_citation_id", "science_results_id",
+            "CitationAuthor", "CitationTitle", "CitationYear", "CitationDOI",
+        ]])
+        df = df[
+            df["science_dam_id"].notna() & df["science_citation_id"].notna()
+        ]
+
+        year = pd.to_numeric(df["CitationYear"], errors="coerce")
+        year_text = year.astype("Int64").astype(str)
+        author = df["CitationAuthor"].astype(object).fillna("nan").astype(str)
+        title = df["CitationTitle"].astype(object).fillna("nan").astype(str)
+        doi = df["CitationDOI"].astype(object)
+
+        df = pd.DataFrame({
+            "science_dam_id": df["science_dam_id"].astype(int),
+            "science_citation_id": df["science_citation_id"].astype(int),
+            "science_results_id": df["science_results_id"],
+            "year": year,
+            "citation": (author + ", " + title).where(
+                year.isna(),
+                author + ", " + year_text + ", " + title,
+            ),
+            "doi": ("https://doi.org/" + doi.fillna("").astype(str)).where(
+                doi.notna()
+            ),
+        })
+
+        # one row per dam and citation, citation attributes are the same
+        # for all rows of a citation id so first non null value is kept
+        grouped = df.groupby(
+            ["science_dam_id", "science_citation_id"], sort=False
+        ).agg({
+            "citation": "first",
+            "doi": "first",
+            "year": "first",
+            "science_results_id": lambda ids: sorted(
+                set(int(i) for i in ids.dropna())
+            ),
+        }).reset_index()
+        grouped = grouped.sort_values(
+            ["science_dam_id", "year", "citation"], na_position="last"
+        )
+
+        citations_by_dam = {}
+        for row in grouped.itertuples(index=False):
+            citations_by_dam.setdefault(str(row.science_dam_id), []).append(
+                DamCitation(
+                    citation=row.citation,
+                    doi=row.doi if pd.notna(row.doi) else None,
+                    year=int(row.year) if pd.notna(row.year) else None,
+                    science_citation_id=int(row.science_citation_id),
+                    science_results_ids=row.science_results_id,
+                )
+            )
+        return cls(citations_by_dam)
+
+    def get(self, dam_id):
+        """Get citations of a dam.
+
+        Parameters
+        ----------
+        dam_id: str or int
+            science dam id
+
+        Returns
+        ----------
+        citations: list
+            DamCitation tuples, empty if dam has no citations
+        """
+        return self._citations.get(str(dam_id), [])
+
+    def __len__(self):
+        """Number of dams with citations."""
+        return len(self._citations)
+
+    def __contains__(self, dam_id):
+        """Check if dam has citations."""
+        return str(dam_id) in self._citations
+
+    def save(self, path):
+        """Write index to gzipped JSON.
+
+        Each citation is stored as a list in DamCitation field order.
+
+        Parameters
+        ----------
+        path: str
+            file to write
+        """
+        data = {"fields": list(DamCitation._fields),
+                "dams": {
+                    dam_id: [list(c) for c in citations]
+                    for dam_id, citations in self._citations.items()
+                }}
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        """Read index written by save().
+
+        Parameters
+        ----------
+        path: str
+            file to read
+
+        Returns
+        ----------
+        index: DamCitationIndex
+            loaded index
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data["fields"] != list(DamCitation._fields):
+            raise ValueError(f"Unexpected citation fields in {path}")
+        citations_by_dam = {
+            dam_id: [DamCitation(*c) for c in citations]
+            for dam_id, citations in data["dams"].items()
+        }
+        return cls(citations_by_dam)
@@ -21,9 +21,12 @@ science database = USGS Dam Removal Science Database
 """
 # Import packages
 import numpy as np
+import pandas as pd
 import sys
 from shapely.geometry import Point
 
+from . import drip_sources
+
 
 class Dam:
     """Builds known information about a dam removal based on sources."""
@@ -73,68 +76,75 @@ class Dam:
     def science_data(self, science_data):
         """Get data about dam from dam removal science data.
 
+        Fields are expected as cast by
+        drip_sources.coerce_science_dam_data, i.e. numbers as numbers,
+        alternate names as lists and a DamHeight_ft column with the
+        height in feet.  A row without DamHeight_ft is taken to be
+        uncoerced and is coerced here first, which is slow when done
+        for every dam, so coerce whole tables before iterating.
+
         Parameters
         ----------
         science_data: tuple
-            Information about dam from dam removal science data
+            Information about dam from dam removal science data,
+            a row of itertuples() or a pandas series
 
         """
+        if not hasattr(science_data, "DamHeight_ft"):
+            science_data = coerce_science_row(science_data)
+
         self.science_dam_id = str(science_data.science_dam_id)
 
-        if ~np.isnan(float(science_data.DamLatitude)) and ~np.isnan(
-            float(science_data.DamLongitude)
+        if pd.notna(science_data.DamLatitude) and pd.notna(
+            science_data.DamLongitude
         ):
             self.latitude = float(science_data.DamLatitude)
             self.longitude = float(science_data.DamLongitude)
 
         # if height value in science database is not null then set value
-        if ~np.isnan(float(science_data.DamHeight_m)):
-            # convert meters to feet
-            self.dam_height_ft = (
-                int(float(science_data.DamHeight_m) * 3.28084)
-            )
+        # (already converted from meters to feet)
+        if pd.notna(science_data.DamHeight_ft):
+            self.dam_height_ft = int(science_data.DamHeight_ft)
+
         # if removal year is not null in the science database then set value
-        if ~np.isnan(science_data.DamYearRemovalFinished):
+        if pd.notna(science_data.DamYearRemovalFinished):
             self.dam_removed_year = int(science_data.DamYearRemovalFinished)
 
         # if year dam built is not null in the science database then set value
-        if ~np.isnan(science_data.DamYearBuiltOriginalStructure):
+        if pd.notna(science_data.DamYearBuiltOriginalStructure):
             self.dam_built_year = int(
                 science_data.DamYearBuiltOriginalStructure
             )
-        elif ~np.isnan(science_data.DamYearBuiltRemovedStructure):
+        elif pd.notna(science_data.DamYearBuiltRemovedStructure):
             self.dam_built_year = int(
                 science_data.DamYearBuiltRemovedStructure
             )
 
         # if dam name is not null in the science database then set value
-        if str(science_data.DamName) != "nan":
-            self.dam_name = str(science_data.DamName).lower()
+        if pd.notna(science_data.DamName):
+            self.dam_name = science_data.DamName
 
         # if stream name is not null in the science database then set value
-        if str(science_data.DamRiverName) != "nan":
-            self.stream_name = str(science_data.DamRiverName).lower()
+        if pd.notna(science_data.DamRiverName):
+            self.stream_name = science_data.DamRiverName
 
         # if dam alt name is not null in the science database then set value
-        if str(science_data.DamNameAlternate) != "nan":
-            self.dam_alt_name = str(
-                science_data.DamNameAlternate
-            ).lower().split(",")
+        # copy lists so updates to the dam do not change the source table
+        if isinstance(science_data.DamNameAlternate, list):
+            self.dam_alt_name = list(science_data.DamNameAlternate)
 
         # if stream alt name is not null in the science database then set value
-        if str(science_data.DamRiverNameAlternate) != "nan":
-            self.stream_alt_name = (
-                str(science_data.DamRiverNameAlternate).lower().split(",")
-            )
+        if isinstance(science_data.DamRiverNameAlternate, list):
+            self.stream_alt_name = list(science_data.DamRiverNameAlternate)
 
         # if american rivers id is not null in science database then set value
-        if str(science_data.AR_ID) != "nan":
-            self.ar_id = str(science_data.AR_ID)
+        if pd.notna(science_data.AR_ID):
+            self.ar_id = science_data.AR_ID
 
         # if nidid (national inventory of dams) is not null in
         # science database then set value
-        if str(science_data.DamNIDID) != "nan":
-            self.nidid = str(science_data.DamNIDID)
+        if pd.notna(science_data.DamNIDID):
+            self.nidid = science_data.DamNIDID
 
     def update_missing_data(self, american_rivers_df):
         """Update missing data using american rivers data.
@@ -159,24 +169,24 @@ class Dam:
             ar_id_data = ar_id_data.reset_index()
 
             # If lat or lon is none populate from AR data
-            if self.latitude is None and ~np.isnan(ar_id_data["Latitude"][0]):
+            if self.latitude is None and pd.notna(ar_id_data["Latitude"][0]):
                 self.latitude = float(ar_id_data["Latitude"][0])
                 self.from_american_rivers.append("latitude")
-            if self.longitude is None and ~np.isnan(ar_id_data["Longitude"][0]):
+            if self.longitude is None and pd.notna(ar_id_data["Longitude"][0]):
                 self.longitude = float(ar_id_data["Longitude"][0])
                 self.from_american_rivers.append("longitude")
             # Update dam build year from AR data if currently none
-            if self.dam_built_year is None and ~np.isnan(ar_id_data["Year_Built"][0]):
+            if self.dam_built_year is None and pd.notna(ar_id_data["Year_Built"][0]):
                 self.dam_built_year = int(ar_id_data["Year_Built"][0])
                 self.from_american_rivers.append("dam_built_year")
             # Update dam remove year from AR data if currently none
-            if self.dam_removed_year is None and ~np.isnan(
+            if self.dam_removed_year is None and pd.notna(
                 ar_id_data["Year_Removed"][0]
             ):
                 self.dam_removed_year = int(ar_id_data["Year_Removed"][0])
                 self.from_american_rivers.append("dam_removed_year")
             # Update dam height from AR data if currently none
-            if self.dam_height_ft is None and ~np.isnan(ar_id_data["Dam_Height_ft"][0]):
+            if self.dam_height_ft is None and pd.notna(ar_id_data["Dam_Height_ft"][0]):
                 self.dam_height_ft = int(float(ar_id_data["Dam_Height_ft"][0]))
                 self.from_american_rivers.append("dam_height_ft")
             # Update stream name from AR data if currently none
@@ -261,6 +271,28 @@ class Dam:
                 print(f"No geometry for id: {self.ar_id}")
 
 
+def coerce_science_row(science_data):
+    """Coerce one row of dam removal science data.
+
+    Parameters
+    ----------
+    science_data: tuple
+        a row of itertuples() or a pandas series of
+        drip_sources.get_science_subset(target='Dam')
+
+    Returns
+    ----------
+    science_data: tuple
+        row cast with drip_sources.coerce_science_dam_data
+    """
+    if isinstance(science_data, pd.Series):
+        fields = science_data.to_dict()
+    else:
+        fields = science_data._asdict()
+    df = drip_sources.coerce_science_dam_data(pd.DataFrame([fields]))
+    return next(df.itertuples(index=False))
+
+
 def clean_name(name):
     """Clean common issues in name fields.
 
@@ -308,6 +340,121 @@ def clean_name(name):
     return main_name, alt_name
 
 
+def clean_names(names):
+    """Clean common issues in a column of names.
+
+    Vectorized version of clean_name, giving the same result for each
+    name.  Missing names give a missing main name and no alt names.
+
+    Parameters
+    ----------
+    names: pandas series
+       initial names of features
+
+    Returns
+    ----------
+    main_names: pandas series
+        names with (alt_name) removed
+    alt_names: pandas series
+        lists of alt names without parentheses
+
+    """
+    names = names.astype(object).str.lower()
+    names = names.str.replace(
+        "/ Anadromous Fish Habitat Restoration", "", regex=False
+    )
+    names = names.str.replace("/Arnold", "(Arnold)", regex=False)
+    names = names.str.replace(
+        "/Horseshoe Pond Dam", "(Horseshoe Pond Dam)", regex=False
+    )
+
+    has_alt = (
+        names.str.contains("(", regex=False)
+        & names.str.contains(")", regex=False)
+    ).fillna(False).astype(bool)
+
+    # text before first "(" and after last ")"
+    main_names = (
+        names.str.extract(r"^([^(]*)", expand=False)
+        + names.str.extract(r"([^)]*)$", expand=False)
+    )
+    main_names = main_names.str.replace("  ", " ", regex=False).str.strip()
+    main_names = main_names.where(has_alt, names)
+
+    # text after first "(" up to the next parenthesis
+    alt = names.str.extract(r"\(([^()]*)", expand=False).str.strip()
+    alt_names = pd.Series(
+        [[a] if h else [] for a, h in zip(alt, has_alt)],
+        index=names.index,
+        dtype=object,
+    )
+
+    return main_names, alt_names
+
+
+def build_ar_dams_table(ar_dams_df):
+    """Build dam records for dams only in the American Rivers Database.
+
+    Builds the same columns that Dam.ar_dam_data and Dam.add_geometry
+    give for each dam, working on whole columns instead of one Dam
+    object per row.
+
+    Parameters
+    ----------
+    ar_dams_df: df
+        pandas dataframe of AR Data,
+        from drip_sources.get_ar_only_dams
+
+    Returns
+    ----------
+    ar_dams: df
+        pandas dataframe with one row per dam,
+        columns match Dam attributes
+
+    """
+    n = len(ar_dams_df)
+    dam_name, dam_alt_name = clean_names(ar_dams_df["Dam_Name"])
+    latitude = ar_dams_df["Latitude"]
+    longitude = ar_dams_df["Longitude"]
+
+    ar_dams = pd.DataFrame({
+        "_id": ar_dams_df["AR_ID"].astype(str),
+        "dam_source": "American Rivers",
+        "ar_id": ar_dams_df["AR_ID"],
+        "latitude": latitude,
+        "longitude": longitude,
+        "dam_built_year": ar_dams_df["Year_Built"],
+        "dam_removed_year": ar_dams_df["Year_Removed"],
+        "dam_height_ft": ar_dams_df["Dam_Height_ft"],
+        "dam_name": dam_name,
+        "stream_name": (
+            ar_dams_df["River"].astype(object).fillna("nan").astype(str)
+            .str.lower()
+        ),
+        "dam_alt_name": dam_alt_name,
+        "stream_alt_name": [[] for _ in range(n)],
+        "from_american_rivers": [[] for _ in range(n)],
+        "science_citation_ids": [[] for _ in range(n)],
+        "science_result_ids": [[] for _ in range(n)],
+        "nidid": ar_dams_df["NID_ID"],
+        "in_drd": 0,
+    }, index=ar_dams_df.index)
+
+    # Convert shapely point to wkt, as in add_geometry
+    geometry = pd.Series(
+        [Point(x, y).wkt for x, y in zip(longitude, latitude)],
+        index=ar_dams_df.index,
+        dtype=object,
+    )
+    no_geometry = geometry == 'POINT (nan nan)'
+    for ar_id in ar_dams_df["AR_ID"][no_geometry]:
+        print(f"No geometry for id: {ar_id}")
+    geometry[no_geometry] = np.nan
+    ar_dams["geometry"] = geometry
+
+    return ar_dams.reset_index(drop=True)
+
+
 def get_unique_names(current_names, new_names):
     """Get unique names between two lists.
 
@@ -0,0 +1,235 @@
+"""Data quality checks of combined dam removal records.
+
+Dams in the Dam Removal Science Database are filled in from American
+Rivers data (see drip_dam.Dam.update_missing_data).  This module flags
+records that look wrong after merging, such as removal years before
+build years, coordinates outside the United States or dam heights that
+look like a unit mistake.  Checks are written as a declarative list of
+rules and every rule is evaluated on whole columns of the dams table.
+
+Rule types
+----------
+compare = column <op> other, rows missing either value pass
+range = column below min or above max, rows missing the value pass
+ratio = column / other between min and max
+outside_boxes = latitude and longitude outside all boxes
+provenance = field was filled in from American Rivers
+all = all of a list of rules apply
+"""
+
+# Import packages
+import operator
+
+import numpy as np
+import pandas as pd
+
+# Bounding boxes (lat min, lat max, lon min, lon max) of the
+# conterminous US, Alaska (both sides of 180), Hawaii and Puerto Rico
+us_boxes = [(24.3, 49.5, -125.0, -66.9),
+            (51.2, 71.5, -179.2, -129.9),
+            (51.2, 53.0, 172.4, 180.0),
+            (18.9, 22.3, -160.3, -154.8),
+            (17.9, 18.6, -67.3, -65.2)]
+
+quality_rules = [
+    {"name": "removed_before_built",
+     "description": "dam removal year is before dam built year",
+     "severity": "error",
+     "type": "compare",
+     "column": "dam_removed_year", "op": "<", "other": "dam_built_year"},
+    {"name": "removal_year_out_of_range",
+     "description": "dam removal year is before 1800 or in the future",
+     "severity": "error",
+     "type": "range",
+     "column": "dam_removed_year", "min": 1800, "max": "current_year"},
+    {"name": "outside_us",
+     "description": "coordinates outside conterminous US, AK, HI and PR",
+     "severity": "error",
+     "type": "outside_boxes",
+     "latitude": "latitude", "longitude": "longitude", "boxes": us_boxes},
+    {"name": "height_out_of_range",
+     "description": "dam height is not between 0 and 800 ft",
+     "severity": "warning",
+     "type": "range",
+     "column": "dam_height_ft", "min": 0, "max": 800},
+    {"name": "height_unit_mismatch",
+     "description": "dam height is about 3.28 times American Rivers height, "
+                    "meters may already have been feet",
+     "severity": "warning",
+     "type": "ratio",
+     "column": "dam_height_ft", "other": "ar_dam_height_ft",
+     "min": 3.0, "max": 3.6},
+    {"name": "removal_year_conflict",
+     "description": "dam removal year differs from American Rivers",
+     "severity": "warning",
+     "type": "compare",
+     "column": "dam_removed_year", "op": "!=", "other": "ar_year_removed"},
+    {"name": "name_conflict",
+     "description": "American Rivers dam name differs from science "
+                    "database name",
+     "severity": "warning",
+     "type": "all",
+     "rules": [{"type": "provenance", "field": "dam_alt_name"},
+               {"type": "provenance", "field": "dam_name",
+                "negate": True}]},
+]
+
+_operators = {"<": operator.lt, "<=": operator.le, ">": operator.gt,
+              ">=": operator.ge, "==": operator.eq, "!=": operator.ne}
+
+
+def add_american_rivers_values(dams_df, american_rivers_df):
+    """Add American Rivers values of each dam for comparison.
+
+    Parameters
+    ----------
+    dams_df: pandas dataframe
+        Return dataframe from bis_pipeline.build_drip_dams_table
+    american_rivers_df: pandas dataframe
+        American Rivers database
+
+    Returns
+    ----------
+    df: pandas dataframe
+        dams_df with ar_dam_height_ft, ar_year_removed and
+        ar_year_built columns
+    """
+    ar_values = american_rivers_df.drop_duplicates("AR_ID")
+    ar_values = pd.DataFrame({
+        "ar_dam_height_ft": ar_values["Dam_Height_ft"].values,
+        "ar_year_removed": ar_values["Year_Removed"].values,
+        "ar_year_built": ar_values["Year_Built"].values,
+    }, index=ar_values["AR_ID"].astype(str).values)
+
+    ar_id = dams_df["ar_id"].where(
+        dams_df["ar_id"].isna(), dams_df["ar_id"].astype(str)
+    )
+    df = dams_df.copy()
+    for column in ar_values.columns:
+        df[column] = ar_id.map(ar_values[column])
+    return df
+
+
+class _RuleContext:
+    """Shared state of one evaluation over a table."""
+
+    def __init__(self, df):
+        self.df = df
+        self._provenance = None
+
+    def numeric(self, column):
+        return pd.to_numeric(self.df[column], errors="coerce")
+
+    def provenance(self):
+        # one row per dam and field filled in from American Rivers
+        if self._provenance is None:
+            self._provenance = self.df["from_american_rivers"].explode()
+        return self._provenance
+
+
+def _resolve(value):
+    if value == "current_year":
+        return pd.Timestamp.today().year
+    return value
+
+
+def _evaluate(rule, context):
+    """Mask of rows flagged by rule."""
+    df = context.df
+    rule_type = rule["type"]
+
+    if rule_type == "compare":
+        column = context.numeric(rule["column"])
+        other = context.numeric(rule["other"])
+        mask = _operators[rule["op"]](column, other)
+        mask &= column.notna() & other.notna()
+
+    elif rule_type == "range":
+        column = context.numeric(rule["column"])
+        mask = pd.Series(False, index=df.index)
+        if rule.get("min") is not None:
+            mask |= column < _resolve(rule["min"])
+        if rule.get("max") is not None:
+            mask |= column > _resolve(rule["max"])
+
+    elif rule_type == "ratio":
+        ratio = context.numeric(rule["column"]) / context.numeric(
+            rule["other"]
+        )
+        ratio = ratio.replace([np.inf, -np.inf], np.nan)
+        mask = (ratio >= rule["min"]) & (ratio <= rule["max"])
+
+    elif rule_type == "outside_boxes":
+        latitude = context.numeric(rule["latitude"])
+        longitude = context.numeric(rule["longitude"])
+        inside = pd.Series(False, index=df.index)
+        for lat_min, lat_max, lon_min, lon_max in rule["boxes"]:
+            inside |= (
+                latitude.between(lat_min, lat_max)
+                & longitude.between(lon_min, lon_max)
+            )
+        mask = ~inside & latitude.notna() & longitude.notna()
+
+    elif rule_type == "provenance":
+        provenance = context.provenance()
+        mask = (provenance == rule["field"]).groupby(level=0).any()
+        mask = mask.reindex(df.index, fill_value=False)
+
+    elif rule_type == "all":
+        mask = pd.Series(True, index=df.index)
+        for sub_rule in rule["rules"]:
+            mask &= _evaluate(sub_rule, context)
+
+    else:
+        raise ValueError(f"Unknown rule type: {rule_type}")
+
+    mask = mask.fillna(False).astype(bool)
+    if rule.get("negate"):
+        mask = ~mask
+    return mask
+
+
+def evaluate_rules(dams_df, rules=None, american_rivers_df=None):
+    """Flag dam records breaking quality rules.
+
+    Parameters
+    ----------
+    dams_df: pandas dataframe
+        Return dataframe from bis_pipeline.build_drip_dams_table
+    rules: list
+        rule dicts, see quality_rules and module docstring,
+        quality_rules when None
+    american_rivers_df: pandas dataframe
+        American Rivers database, needed by rules using ar_ columns
+
+    Returns
+    ----------
+    report: pandas dataframe
+        one row per flagged dam and rule with columns
+        _id, dam_source, rule, severity and description
+    """
+    rules = quality_rules if rules is None else rules
+    df = dams_df.reset_index(drop=True)
+    if american_rivers_df is not None:
+        df = add_american_rivers_values(df, american_rivers_df)
+
+    context = _RuleContext(df)
+    flagged = []
+    for rule in rules:
+        columns = [rule.get(key) for key in ["column", "other"]]
+        if any(c is not None and c not in df.columns for c in columns):
+            # rule needs values that are not available, e.g. ar_ columns
+            continue
+        mask = _evaluate(rule, context)
+        flagged.append(pd.DataFrame({
+            "_id": df.loc[mask, "_id"].values,
+            "dam_source": df.loc[mask, "dam_source"].values,
+            "rule": rule["name"],
+            "severity": rule.get("severity", "warning"),
+            "description": rule.get("description", ""),
+        }))
+
+    columns = ["_id", "dam_source", "rule", "severity", "description"]
+    if not flagged:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(flagged, ignore_index=True)[columns]
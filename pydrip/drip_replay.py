@@ -0,0 +1,365 @@
+"""Record and replay HTTP traffic made while retrieving DRIP sources.
+
+Source retrieval in drip_sources talks to DataCite, ScienceBase (through
+sciencebasepy) and Figshare.  This module captures those HTTP exchanges
+to a fixture directory so that tests and benchmarks can be run again on
+a machine without network access.  A small stub server is also provided
+that serves recorded source files with configurable latency and chunked
+transfer, standing in for the ScienceBase and Figshare download hosts.
+
+Notes
+----------
+All requests made by the requests package, including those made by
+sciencebasepy, pass through requests.Session.send.  Recording and
+replay are done by temporarily replacing that method.
+
+Modes
+----------
+live = pass requests through untouched
+record = pass requests through and save each response as a fixture
+replay = answer requests only from fixtures, never touching the network
+"""
+
+# Import packages
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote, urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+MODES = ["live", "record", "replay"]
+
+# Headers describing the transfer rather than the content, these are
+# not valid once the body has been read and stored
+_transfer_headers = ["content-encoding", "transfer-encoding", "content-length"]
+
+_original_send = requests.Session.send
+
+loopback_hosts = ["127.0.0.1", "localhost", "::1"]
+
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """Raised in replay mode when no fixture exists for a request."""
+
+
+class HttpRecorder:
+    """Record or replay HTTP responses to and from a fixture directory."""
+
+    def __init__(self, fixture_dir, mode="replay", passthrough_hosts=()):
+        """Initiate recorder.
+
+        Parameters
+        ----------
+        fixture_dir: str
+            directory where fixtures are written to or read from
+        mode: str
+            options: 'live', 'record', 'replay'
+        passthrough_hosts: list
+            host names whose requests are passed on untouched,
+            e.g. loopback hosts of a StubSourceServer
+
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}. Only accepts {MODES}")
+        self.fixture_dir = fixture_dir
+        self.mode = mode
+        self.passthrough_hosts = list(passthrough_hosts)
+        self.calls = []
+        self._lock = threading.Lock()
+        self._previous_send = _original_send
+
+    def __enter__(self):
+        """Install recorder for the duration of a with block."""
+        self.install()
+        return self
+
+    def __exit__(self, *exc):
+        """Restore the previous requests behavior."""
+        self.uninstall()
+
+    def install(self):
+        """Route all requests sessions through this recorder."""
+        recorder = self
+
+        def send(session, request, **kwargs):
+            return recorder.send(session, request, **kwargs)
+
+        self._previous_send = requests.Session.send
+        requests.Session.send = send
+
+    def uninstall(self):
+        """Restore requests.Session.send as it was before install()."""
+        requests.Session.send = self._previous_send
+
+    def send(self, session, request, **kwargs):
+        """Handle a prepared request according to the recorder mode.
+
+        Parameters
+        ----------
+        session: requests.Session
+            session sending the request
+        request: requests.PreparedRequest
+            request to be sent
+
+        Returns
+        ----------
+        response: requests.Response
+            live or replayed response
+
+        """
+        if urlparse(request.url).hostname in self.passthrough_hosts:
+            return self._previous_send(session, request, **kwargs)
+
+        key = fixture_key(request)
+        with self._lock:
+            self.calls.append({"method": request.method,
+                               "url": request.url,
+                               "key": key})
+
+        if self.mode == "replay":
+            return self.load(key, request)
+
+        response = self._previous_send(session, request, **kwargs)
+        if self.mode == "record":
+            self.save(key, request, response)
+        return response
+
+    def save(self, key, request, response):
+        """Write response metadata and body to the fixture directory.
+
+        Parameters
+        ----------
+        key: str
+            fixture key from fixture_key()
+        request: requests.PreparedRequest
+            request that produced the response
+        response: requests.Response
+            response to store
+
+        """
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        meta = {"method": request.method,
+                "url": request.url,
+                "status_code": response.status_code,
+                "reason": response.reason,
+                "encoding": response.encoding,
+                "headers": {
+                    k: v for k, v in response.headers.items()
+                    if k.lower() not in _transfer_headers
+                }}
+        # reading content here consumes streamed responses, the body
+        # remains available on the response object after this
+        body = response.content
+        path = os.path.join(self.fixture_dir, key)
+        with open(f"{path}.body", "wb") as f:
+            f.write(body)
+        with open(f"{path}.json", "w") as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+
+    def load(self, key, request):
+        """Build a response for a request from its stored fixture.
+
+        Parameters
+        ----------
+        key: str
+            fixture key from fixture_key()
+        request: requests.PreparedRequest
+            request being answered
+
+        Returns
+        ----------
+        response: requests.Response
+            response rebuilt from fixture
+
+        """
+        path = os.path.join(self.fixture_dir, key)
+        if not os.path.exists(f"{path}.json"):
+            raise ReplayMissError(
+                f"No recorded fixture for {request.method} {request.url}",
+                request=request,
+            )
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        with open(f"{path}.body", "rb") as f:
+            body = f.read()
+
+        response = requests.Response()
+        response.status_code = meta["status_code"]
+        response.reason = meta["reason"]
+        response.encoding = meta["encoding"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response.url = meta["url"]
+        response.request = request
+        # body is already read, streamed reads and close() use raw
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        return response
+
+
+def fixture_key(request):
+    """Build a stable file name for a request.
+
+    Parameters
+    ----------
+    request: requests.PreparedRequest
+        request to build key for
+
+    Returns
+    ----------
+    key: str
+        hex digest of method, url and body
+
+    """
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    digest = hashlib.sha1()
+    digest.update(request.method.encode("utf-8"))
+    digest.update(request.url.encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def recorder_from_env(default_dir):
+    """Build recorder from PYDRIP_HTTP_MODE and PYDRIP_HTTP_FIXTURES.
+
+    Parameters
+    ----------
+    default_dir: str
+        fixture directory used when PYDRIP_HTTP_FIXTURES is not set
+
+    Returns
+    ----------
+    recorder: HttpRecorder or None
+        None when mode is live or not set, requests to loopback
+        hosts (stub servers) are passed through
+
+    """
+    mode = os.environ.get("PYDRIP_HTTP_MODE", "live")
+    if mode == "live":
+        return None
+    fixture_dir = os.environ.get("PYDRIP_HTTP_FIXTURES", default_dir)
+    return HttpRecorder(fixture_dir, mode=mode,
+                        passthrough_hosts=loopback_hosts)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubSourceServer:
+    """Local HTTP server serving recorded source files.
+
+    Files in root_dir are served by name.  Each response waits
+    latency seconds before the first byte and is sent with chunked
+    transfer encoding in pieces of chunk_size bytes, with chunk_delay
+    seconds between pieces, approximating a slow download host.
+    """
+
+    def __init__(self, root_dir, latency=0.0, chunk_size=65536,
+                 chunk_delay=0.0, host="127.0.0.1", port=0):
+        """Initiate stub server.
+
+        Parameters
+        ----------
+        root_dir: str
+            directory with files to serve
+        latency: float
+            seconds to wait before responding
+        chunk_size: int
+            bytes per chunk of response body
+        chunk_delay: float
+            seconds to wait between chunks
+        host: str
+            interface to bind
+        port: int
+            port to bind, 0 picks a free port
+
+        """
+        self.root_dir = root_dir
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.requests_served = 0
+        self._served_lock = threading.Lock()
+        self._server = _ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        """Url of server root."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, name):
+        """Url serving the file with the given name."""
+        return f"{self.base_url}/{name}"
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Shut down server."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        """Start server for the duration of a with block."""
+        return self.start()
+
+    def __exit__(self, *exc):
+        """Stop server."""
+        self.stop()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                name = unquote(urlparse(self.path).path).lstrip("/")
+                path = os.path.join(stub.root_dir, name)
+                if (
+                    not os.path.isfile(path)
+                    or os.path.commonpath(
+                        [os.path.abspath(path), os.path.abspath(stub.root_dir)]
+                    ) != os.path.abspath(stub.root_dir)
+                ):
+                    self.send_error(404)
+                    return
+
+                time.sleep(stub.latency)
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                with open(path, "rb") as f:
+                    while True:
+                        chunk = f.read(stub.chunk_size)
+                        if not chunk:
+                            break
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        time.sleep(stub.chunk_delay)
+                self.wfile.write(b"0\r\n\r\n")
+                with stub._served_lock:
+                    stub.requests_served += 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
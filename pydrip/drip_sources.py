@@ -22,10 +22,50 @@ import re
 from sciencebasepy import SbSession
 import pandas as pd
 import io
+import json
+import os
+import tempfile
 import numpy as np
 
 sb = SbSession()
 
+science_schema_path = os.path.join(
+    os.path.dirname(__file__), "resources", "drsd-schema.json"
+)
+
+# rename accession fields of science database
+science_rename = {"CitationAccessionNumber": "science_citation_id",
+                  "DamAccessionNumber": "science_dam_id",
+                  "DesignID": "science_design_id",
+                  "ResultsID": "science_results_id"}
+
+# Column groups of the science database, selected by (renamed) column
+# name in the same way get_science_subset selects columns of a target
+science_column_groups = {
+    "Dam": lambda c: "Dam" in c or c in ["science_dam_id", "AR_ID"],
+    "Citation": lambda c: "Citation" in c or c == "science_citation_id",
+    "Design": lambda c: "Design" in c or c == "science_design_id",
+    "Results": lambda c: (
+        "Results" in c or c in ["science_results_id", "science_citation_id"]
+    ),
+    "Accession": lambda c: "Accession" in c or c.startswith("science_"),
+}
+
+# Column groups needed by each get_science_subset target,
+# None means all columns
+subset_column_groups = {
+    "Dam": ["Dam"],
+    "Accession": ["Accession"],
+    "Results": ["Results"],
+    "Citation": ["Citation"],
+    "DamCitations": ["Citation", "Accession"],
+    "Design": ["Design"],
+    "dam removal science": None,
+}
+
+# pandas dtypes of science database columns, see get_science_dtypes
+_science_dtypes = None
+
 ######################################################################
 ######################################################################
 
@@ -102,7 +142,200 @@ def get_american_rivers_data_url(
     return file_url
 
 
-def read_american_rivers(file_url):
+# Text columns with few distinct values repeated across many rows.
+# These can be kept as pandas categoricals to save memory
+american_rivers_categorical_columns = [
+    "State",
+    "River",
+    "City",
+    "County",
+]
+
+science_categorical_columns = [
+    "DamState_Province",
+    "DamCountry",
+    "DamRiverName",
+    "DamCoordinateSource",
+    "DamMapDatum",
+    "DamAccuracyOfLocation",
+    "DamRemovalMethod",
+    "DamFunction",
+    "DamOperation",
+    "DamOwner",
+    "CitationAuthor",
+    "CitationJournalOrConferenceName",
+    "CitationDocumentCategory",
+    "CitationPublisher",
+    "DesignTypeOfStudy",
+    "ResultsDataQuality",
+    "ResultsPrimaryFocusOfStudy",
+]
+
+dam_categorical_columns = [
+    "dam_source",
+    "stream_name",
+]
+
+
+def encode_categories(df, columns):
+    """Convert repetitive text columns to pandas categoricals.
+
+    Parameters
+    ----------
+    df: pandas dataframe
+        dataframe to encode, columns not in df are skipped
+    columns: list
+        names of columns to encode
+
+    Returns
+    ----------
+    df: pandas dataframe
+        dataframe with listed columns as categoricals
+    """
+    df = df.copy()
+    for column in columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def category_memory_report(df, columns):
+    """Compare memory of plain and categorical representations.
+
+    Parameters
+    ----------
+    df: pandas dataframe
+        dataframe to report on, encoded or not
+    columns: list
+        names of columns to compare, columns not in df are skipped
+
+    Returns
+    ----------
+    report: pandas dataframe
+        bytes per column as plain objects and as categoricals,
+        with a total row
+    """
+    report = []
+    for column in columns:
+        if column not in df.columns:
+            continue
+        values = df[column]
+        plain = values.astype(object).memory_usage(index=False, deep=True)
+        encoded = values.astype("category").memory_usage(
+            index=False, deep=True
+        )
+        report.append({"column": column,
+                       "distinct_values": values.nunique(),
+                       "plain_bytes": plain,
+                       "encoded_bytes": encoded})
+
+    report = pd.DataFrame(
+        report,
+        columns=["column", "distinct_values", "plain_bytes", "encoded_bytes"],
+    )
+    total = {"column": "total",
+             "distinct_values": report["distinct_values"].sum(),
+             "plain_bytes": report["plain_bytes"].sum(),
+             "encoded_bytes": report["encoded_bytes"].sum()}
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    report["ratio"] = report["encoded_bytes"] / report["plain_bytes"]
+    return report
+
+
+def get_source_content(file_url):
+    """Get raw content of a source file.
+
+    Source files are downloaded with requests so that every download
+    can be recorded and replayed (see drip_replay).  Local file paths
+    are also accepted.
+
+    Parameters
+    ----------
+    file_url: str
+        Url or local path of source file
+
+    Returns
+    ----------
+    content: bytes
+        Raw content of source file
+
+    """
+    if re.match("^https?://", str(file_url)):
+        return requests.get(file_url).content
+    with open(file_url, "rb") as f:
+        return f.read()
+
+
+def spool_source(file_url, chunk_size=1048576):
+    """Download a source file to a temporary file.
+
+    The response is streamed and written in chunks, so the file is
+    never held in memory as a whole.
+
+    Parameters
+    ----------
+    file_url: str
+        Url of source file
+    chunk_size: int
+        bytes written per chunk
+
+    Returns
+    ----------
+    path: str
+        path of temporary file, the caller removes it
+
+    """
+    fd, path = tempfile.mkstemp(prefix="pydrip-", suffix=".csv")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            with requests.get(file_url, stream=True) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(chunk_size):
+                    f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def get_source_version(file_url):
+    """Identify the version of a source file without reading it.
+
+    Local files are identified by size and modification time.  Urls are
+    identified by the ETag, Last-Modified and Content-Length headers of a
+    HEAD request.  Many download hosts (e.g. presigned or redirecting
+    urls) refuse HEAD requests or send none of these headers, then no
+    version is known and the content has to be read to tell versions
+    apart.
+
+    Parameters
+    ----------
+    file_url: str
+        Url or local path of source file
+
+    Returns
+    ----------
+    version: tuple or None
+        values that change when the source file changes,
+        None when the version is unknown
+
+    """
+    if re.match("^https?://", str(file_url)):
+        response = requests.head(file_url, allow_redirects=True)
+        if not response.ok:
+            return None
+        version = tuple(
+            response.headers.get(header)
+            for header in ["ETag", "Last-Modified", "Content-Length"]
+        )
+        if all(value is None for value in version):
+            return None
+        return version
+    stat = os.stat(file_url)
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def read_american_rivers(file_url, categorical=False):
     """Read in American Rivers Dam Removal Database into pandas dataframe.
 
     Parameters
@@ -110,6 +343,8 @@ def read_american_rivers(file_url):
     file_url: str
         Url to access American Rivers database
         Get from get_american_rivers_data_url()
+    categorical: bool
+        If True keep american_rivers_categorical_columns as categoricals
 
     Returns
     ----------
@@ -117,46 +352,425 @@ def read_american_rivers(file_url):
         Pandas dataframe with American Rivers Dam Removal Database
 
     """
-    raw_data = requests.get(file_url).content
+    raw_data = get_source_content(file_url)
     df = pd.read_csv(io.StringIO(raw_data.decode("utf-8")))
     # remove unnamed columns
     df = df[df.columns[~df.columns.str.contains("Unnamed:")]]
     df["Year_Removed"] = pd.to_numeric(df["Year_Removed"], errors="coerce")
     df["Year_Built"] = pd.to_numeric(df["Year_Built"], errors="coerce")
     df["Dam_Height_ft"] = pd.to_numeric(df["Dam_Height_ft"], errors="coerce")
+    if categorical:
+        df = encode_categories(df, american_rivers_categorical_columns)
     return df
 
 
-def read_science_data(file_url):
+def get_science_dtypes():
+    """Get pandas dtypes of text columns from drsd-schema.json.
+
+    The schema is read once and kept for later calls.
+
+    Returns
+    ----------
+    dtypes: dict
+        column name to object for columns of type string, numeric
+        columns are left to the csv parser
+    """
+    global _science_dtypes
+    if _science_dtypes is None:
+        with open(science_schema_path) as f:
+            properties = json.load(f)["items"]["properties"]
+        _science_dtypes = {
+            column: object
+            for column, definition in properties.items()
+            if definition.get("type") == "string"
+        }
+    return _science_dtypes
+
+
+class ScienceSource:
+    """USGS Dam Removal Science Database file read by column groups.
+
+    A url is downloaded on the first read, in chunks, to a temporary
+    file that further reads of other column groups use, so the file is
+    downloaded once and never held in memory as a whole.  Local paths
+    are read in place.  The temporary file is removed by close(), or on
+    leaving a with block.
+    """
+
+    def __init__(self, file_url):
+        """Initiate source.
+
+        Parameters
+        ----------
+        file_url: str
+            Url or local path of dam removal science database
+            Get from get_science_data_url()
+
+        """
+        self.file_url = file_url
+        self._path = None
+        self._spooled = False
+        self._header = None
+
+    def __enter__(self):
+        """Use source for the duration of a with block."""
+        return self
+
+    def __exit__(self, *exc):
+        """Remove the downloaded file."""
+        self.close()
+
+    @property
+    def path(self):
+        """Local path of the file, urls are downloaded on first use."""
+        if self._path is None:
+            if re.match("^https?://", str(self.file_url)):
+                self._path = spool_source(self.file_url)
+                self._spooled = True
+            else:
+                self._path = self.file_url
+        return self._path
+
+    def close(self):
+        """Remove the downloaded file, a later read downloads it again."""
+        if self._spooled:
+            os.remove(self._path)
+        self._path = None
+        self._spooled = False
+
+    def columns(self, groups=None):
+        """Get file column names of column groups.
+
+        Parameters
+        ----------
+        groups: list
+            Names of science_column_groups, None selects all columns
+
+        Returns
+        ----------
+        columns: list
+            column names as in the file, in file order
+        """
+        if self._header is None:
+            self._header = list(pd.read_csv(
+                self.path, encoding="ISO-8859-1", nrows=0
+            ).columns)
+        if groups is None:
+            return list(self._header)
+        return [
+            c for c in self._header
+            if any(science_column_groups[group](science_rename.get(c, c))
+                   for group in groups)
+        ]
+
+    def read(self, groups=None, categorical=False):
+        """Read columns of column groups, see read_science_data."""
+        selected = self.columns(groups)
+        dtypes = get_science_dtypes()
+        df = pd.read_csv(
+            self.path,
+            encoding="ISO-8859-1",
+            usecols=selected,
+            dtype={
+                c: dtypes[science_rename.get(c, c)] for c in selected
+                if science_rename.get(c, c) in dtypes
+            },
+        )
+        # keep file column order
+        df = df[selected].rename(columns=science_rename)
+
+        if categorical:
+            df = encode_categories(df, science_categorical_columns)
+
+        return df
+
+    def read_subset(self, target="Dam", categorical=False):
+        """Read only the columns needed for one subset.
+
+        Parameters
+        ----------
+        target: str
+            see get_science_subset
+        categorical: bool
+            If True keep science_categorical_columns as categoricals
+
+        Returns
+        ----------
+        df: pandas dataframe
+            subset from get_science_subset
+        """
+        science_df = self.read(subset_column_groups[target], categorical)
+        return get_science_subset(science_df, target)
+
+
+def read_science_data(file_url, categorical=False, groups=None):
     """Read in USGS Dam Removal Science Database in pandas dataframe.
 
     Reads in the flattened version (CSV) of the USGS Dam Removal
-    Science Database into pandas dataframe.
+    Science Database into pandas dataframe.  Text columns are read as
+    strings as typed in drsd-schema.json.
 
     Parameters
     ----------
     file_url: str
         Url to access dam removal science database
         Get from get_science_data_url()
+    categorical: bool
+        If True keep science_categorical_columns as categoricals
+    groups: list
+        Names of science_column_groups to read, None reads all columns.
+        Use a ScienceSource to read several groups with one download
 
     Returns
     ----------
     df: pandas dataframe
         Pandas dataframe with Dam Removal Science Database
     """
-    df = pd.read_csv(file_url, encoding="ISO-8859-1")
+    with ScienceSource(file_url) as science_source:
+        return science_source.read(groups, categorical)
+
+
+def read_science_subset(file_url, target="Dam", categorical=False):
+    """Read only the columns needed for one subset of the science database.
+
+    Parameters
+    ----------
+    file_url: str
+        Url to access dam removal science database
+    target: str
+        see get_science_subset
+    categorical: bool
+        If True keep science_categorical_columns as categoricals
 
-    # rename accession fields
-    rename = {"CitationAccessionNumber": "science_citation_id",
-              "DamAccessionNumber": "science_dam_id",
-              "DesignID": "science_design_id",
-              "ResultsID": "science_results_id"}
+    Returns
+    ----------
+    df: pandas dataframe
+        subset from get_science_subset
+    """
+    with ScienceSource(file_url) as science_source:
+        return science_source.read_subset(target, categorical)
+
+
+# Types of dam fields in the science database, used by
+# coerce_science_dam_data to cast whole columns at once
+science_dam_field_types = {
+    "DamYearRemovalFinished": "year",
+    "DamYearBuiltOriginalStructure": "year",
+    "DamYearBuiltRemovedStructure": "year",
+    "DamLatitude": "coordinate",
+    "DamLongitude": "coordinate",
+    "DamHeight_m": "meters",
+    "DamName": "name",
+    "DamRiverName": "name",
+    "DamNameAlternate": "name_list",
+    "DamRiverNameAlternate": "name_list",
+    "AR_ID": "identifier",
+    "DamNIDID": "identifier",
+}
+
+
+def coerce_science_dam_data(dam_science_df):
+    """Cast dam fields of the science database to clean types.
+
+    Casts each column listed in science_dam_field_types once, so that
+    per dam code (drip_dam.Dam.science_data) only has to check for
+    missing values.  Missing values are left as missing in all cases.
+
+    year: nullable integer (Int64), truncated
+    coordinate: float
+    meters: float, plus a <field>_ft column with the height in
+        feet as nullable integer, truncated
+    name: lower case string
+    name_list: list of lower case strings split on commas
+    identifier: string
 
-    df = df.rename(columns=rename)
+    Parameters
+    ----------
+    dam_science_df: pandas dataframe
+        Return dataframe from get_science_subset(target='Dam')
 
+    Returns
+    ----------
+    df: pandas dataframe
+        Copy of dam_science_df with coerced columns
+    """
+    df = dam_science_df.copy()
+    for field, field_type in science_dam_field_types.items():
+        if field not in df.columns:
+            continue
+        values = df[field]
+        if field_type == "year":
+            df[field] = np.trunc(
+                pd.to_numeric(values, errors="coerce")
+            ).astype("Int64")
+        elif field_type == "coordinate":
+            df[field] = pd.to_numeric(values, errors="coerce").astype(float)
+        elif field_type == "meters":
+            meters = pd.to_numeric(values, errors="coerce").astype(float)
+            df[field] = meters
+            # convert meters to feet
+            df[field.replace("_m", "_ft")] = np.trunc(
+                meters * 3.28084
+            ).astype("Int64")
+        else:
+            present = values.dropna().astype(str)
+            if field_type == "name":
+                present = present.str.lower()
+            elif field_type == "name_list":
+                present = present.str.lower().str.split(",")
+            df[field] = present.reindex(df.index).astype(object)
     return df
 
 
+def get_list_columns(df):
+    """Find object columns holding lists.
+
+    Only the first non-missing value of each object column is checked,
+    columns are expected to hold lists in every row or in none.
+
+    Parameters
+    ----------
+    df: pandas dataframe
+        dataframe to check
+
+    Returns
+    ----------
+    columns: list
+        names of columns holding lists
+    """
+    list_columns = []
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != object:
+            continue
+        values = values[values.notna().values]
+        if len(values) and isinstance(values.iloc[0], list):
+            list_columns.append(column)
+    return list_columns
+
+
+def row_fingerprint(df, columns=None, list_columns=None):
+    """Compute a stable 64 bit hash of each row.
+
+    Rows with equal values in the selected columns get equal
+    fingerprints, so a fingerprint can stand in for the row when
+    finding duplicates or changes.  Values of text columns are hashed
+    by their text, so e.g. 1 and '1' get the same fingerprint.  Cells
+    holding lists (e.g. alt names in the dams table) are hashed by their
+    text representation.
+
+    Parameters
+    ----------
+    df: pandas dataframe
+        dataframe to fingerprint
+    columns: list
+        columns to include, None includes all columns
+    list_columns: list
+        columns holding lists, found with get_list_columns when None
+
+    Returns
+    ----------
+    fingerprint: pandas series
+        uint64 hash per row, same index as df
+    """
+    if columns is not None:
+        df = df[columns]
+    if list_columns is None:
+        list_columns = get_list_columns(df)
+    if list_columns:
+        df = df.copy()
+        for column in list_columns:
+            df[column] = df[column].map(repr)
+    return pd.util.hash_pandas_object(df, index=False)
+
+
+def drop_duplicate_rows(df, columns=None):
+    """Drop duplicate rows using row fingerprints.
+
+    Rows are first grouped by fingerprint and only rows sharing a
+    fingerprint are compared value by value, so a hash collision never
+    drops a row.  Rows are dropped only when their fingerprints and
+    their values are both equal.  Results can differ from
+    df.drop_duplicates(subset=columns) only for text columns mixing
+    value types, such as 1 and 1.0 or None and NaN in one column.
+
+    Parameters
+    ----------
+    df: pandas dataframe
+        dataframe to deduplicate
+    columns: list
+        columns identifying duplicates, None uses all columns
+
+    Returns
+    ----------
+    df: pandas dataframe
+        first occurrence of each distinct row
+    """
+    selected = df if columns is None else df[columns]
+    list_columns = get_list_columns(selected)
+    fingerprints = row_fingerprint(selected, list_columns=list_columns)
+    candidates = fingerprints.duplicated(keep=False).values
+    if not candidates.any():
+        return df
+
+    # confirm rows sharing a fingerprint hold equal values
+    confirm = selected[candidates].copy()
+    for column in list_columns:
+        confirm[column] = confirm[column].map(
+            lambda x: tuple(x) if isinstance(x, list) else x
+        )
+    confirm["_fingerprint"] = fingerprints.values[candidates]
+    duplicated = np.zeros(len(df), dtype=bool)
+    duplicated[candidates] = confirm.duplicated().values
+    return df[~duplicated]
+
+
+def get_changed_rows(old_df, new_df, key, columns=None):
+    """Compare two versions of a table by row fingerprint.
+
+    Parameters
+    ----------
+    old_df: pandas dataframe
+        previous version of table
+    new_df: pandas dataframe
+        current version of table
+    key: str
+        column uniquely identifying a row in both versions,
+        ValueError is raised when it holds duplicates
+    columns: list
+        columns compared, None uses columns found in both versions
+
+    Returns
+    ----------
+    changes: dict
+        lists of key values under 'added', 'removed' and 'changed',
+        and column names under 'added_columns' and 'removed_columns'
+    """
+    for df in [old_df, new_df]:
+        if df[key].duplicated().any():
+            raise ValueError(f"Key column {key} is not unique")
+    if columns is None:
+        columns = [c for c in new_df.columns if c in old_df.columns]
+    old = pd.Series(
+        row_fingerprint(old_df, columns).values, index=old_df[key].values
+    )
+    new = pd.Series(
+        row_fingerprint(new_df, columns).values, index=new_df[key].values
+    )
+    both = new.index.intersection(old.index)
+    changed = both[new[both].values != old[both].values]
+    changes = {"added": list(new.index.difference(old.index)),
+               "removed": list(old.index.difference(new.index)),
+               "changed": list(changed),
+               "added_columns": [
+                   c for c in new_df.columns if c not in old_df.columns
+               ],
+               "removed_columns": [
+                   c for c in old_df.columns if c not in new_df.columns
+               ]}
+    return changes
+
+
 def get_science_subset(science_df, target="Dam"):
     """Return subsets of USGS Dam Removal Science Database.
 
@@ -184,7 +798,7 @@ def get_science_subset(science_df, target="Dam"):
         dam_data_all = dam_data_all.drop(
             ["DesignNumOfDamsRemoved"], axis=1
         )  # get rid of unwanted field
-        dam_data = dam_data_all.drop_duplicates()
+        dam_data = drop_duplicate_rows(dam_data_all)
         return dam_data
 
     elif target == "Accession":
@@ -195,7 +809,7 @@ def get_science_subset(science_df, target="Dam"):
                 | science_df.columns.str.contains("science_")
             ]
         ]
-        accession_data = accession_data_all.drop_duplicates()
+        accession_data = drop_duplicate_rows(accession_data_all)
         return accession_data
 
     elif target == "Results":
@@ -207,7 +821,7 @@ def get_science_subset(science_df, target="Dam"):
                 | science_df.columns.str.match("science_citation_id")
             ]
         ]
-        results_data = results_data_all.drop_duplicates()
+        results_data = drop_duplicate_rows(results_data_all)
         return results_data
 
     elif target == "Citation":
@@ -218,7 +832,7 @@ def get_science_subset(science_df, target="Dam"):
                 | science_df.columns.str.match("science_citation_id")
             ]
         ]
-        citation_data = citation_data_all.drop_duplicates().reset_index()
+        citation_data = drop_duplicate_rows(citation_data_all).reset_index()
 
         citation_data['doi_url'] = np.where(
             citation_data['CitationDOI'].isna(),
@@ -228,8 +842,8 @@ def get_science_subset(science_df, target="Dam"):
 
         citation_data['citation_short'] = np.where(
             citation_data['CitationYear'].notna(),
-            citation_data['CitationAuthor'] + ', ' + citation_data['CitationTitle'],
-            citation_data['CitationAuthor'] + ', ' + citation_data['CitationYear'].astype(str) + ', ' + citation_data['CitationTitle']
+            citation_data['CitationAuthor'].astype(object) + ', ' + citation_data['CitationTitle'],
+            citation_data['CitationAuthor'].astype(object) + ', ' + citation_data['CitationYear'].astype(str) + ', ' + citation_data['CitationTitle']
         )
 
         return citation_data
@@ -243,7 +857,7 @@ def get_science_subset(science_df, target="Dam"):
             ]
         ]
         # Remove all duplicate records
-        dam_citation_data = dam_citation_data_all.drop_duplicates()
+        dam_citation_data = drop_duplicate_rows(dam_citation_data_all)
         relevant = []
         for citation in dam_citation_data.itertuples():
             # Build citation information per dam
@@ -273,7 +887,7 @@ def get_science_subset(science_df, target="Dam"):
                 | science_df.columns.str.match("science_design_id")
             ]
         ]
-        design_data = design_data_all.drop_duplicates()
+        design_data = drop_duplicate_rows(design_data_all)
         return design_data
 
     # Return entire dam removal science database
@@ -287,8 +901,8 @@ def get_science_subset(science_df, target="Dam"):
         # Creates short citation
         science_df['citation_short'] = np.where(
             science_df['CitationYear'].notna(),
-            science_df['CitationAuthor'] + ', ' + science_df['CitationTitle'],
-            science_df['CitationAuthor'] + ', ' + science_df['CitationYear'].astype(str) + ', ' + science_df['CitationTitle']
+            science_df['CitationAuthor'].astype(object) + ', ' + science_df['CitationTitle'],
+            science_df['CitationAuthor'].astype(object) + ', ' + science_df['CitationYear'].astype(str) + ', ' + science_df['CitationTitle']
         )
         return science_df
 
@@ -304,7 +918,8 @@ def get_ar_only_dams(american_rivers_df, dam_science_df):
     american_rivers_df: pandas dataframe of full American Rivers Database
     dam_science_df: pandas dataframe of full USGS Dam Removal Science Database
     """
-    ar_in_science = dam_science_df["AR_ID"].dropna().to_list()
+    # anti-join on AR_ID
+    ar_in_science = dam_science_df["AR_ID"].dropna().unique()
     ar_only_dams = american_rivers_df[
         ~american_rivers_df["AR_ID"].isin(ar_in_science)
     ]
@@ -0,0 +1,313 @@
+"""Summary statistics of dam removals for DRIP charts.
+
+This module aggregates the combined dams table (see
+bis_pipeline.build_drip_dams_table) into a cube of removal, citation
+and result counts by removal year, state, dam height class and source.
+The cube is built with vectorized groupbys, saved alongside other
+outputs, and can be sliced and rolled up without touching the dams
+table again.
+
+Notes
+----------
+Each dam is one row of the fact table, holding its dimension values and
+its citation and result counts.  Cube cells are sums over fact rows, so
+when only some dams change the cube is updated by subtracting the old
+fact rows of those dams and adding the new ones.
+"""
+
+# Import packages
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import drip_sources
+
+dimensions = ["dam_removed_year", "state", "height_class", "dam_source"]
+measures = ["removals", "citations", "results"]
+
+# Upper bound (ft) and label of dam height classes
+height_classes = [(5, "<5 ft"),
+                  (10, "5-10 ft"),
+                  (25, "10-25 ft"),
+                  (50, "25-50 ft"),
+                  (100, "50-100 ft"),
+                  (np.inf, ">100 ft")]
+
+# Values of dimensions when the dam attribute is unknown
+unknown = "unknown"
+unknown_year = 0
+
+# Science database records full state names, American Rivers
+# records postal abbreviations. States are reported as abbreviations
+state_abbreviations = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR",
+    "california": "CA", "colorado": "CO", "connecticut": "CT",
+    "delaware": "DE", "district of columbia": "DC", "florida": "FL",
+    "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY",
+    "louisiana": "LA", "maine": "ME", "maryland": "MD",
+    "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT",
+    "nebraska": "NE", "nevada": "NV", "new hampshire": "NH",
+    "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH",
+    "oklahoma": "OK", "oregon": "OR", "pennsylvania": "PA",
+    "puerto rico": "PR", "rhode island": "RI", "south carolina": "SC",
+    "south dakota": "SD", "tennessee": "TN", "texas": "TX", "utah": "UT",
+    "vermont": "VT", "virginia": "VA", "washington": "WA",
+    "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+
+
+def get_dam_states(dams_df, dam_science_df, american_rivers_df):
+    """Get state of each dam.
+
+    State comes from American Rivers when the dam has an AR id and from
+    the science database otherwise.
+
+    Parameters
+    ----------
+    dams_df: pandas dataframe
+        Return dataframe from bis_pipeline.build_drip_dams_table
+    dam_science_df: pandas dataframe
+        Return dataframe from drip_sources.get_science_subset(target='Dam')
+    american_rivers_df: pandas dataframe
+        American Rivers database
+
+    Returns
+    ----------
+    states: pandas series
+        state abbreviation per dam, same index as dams_df
+    """
+    ar_states = pd.Series(dtype=object)
+    if "State" in american_rivers_df.columns:
+        ar_states = american_rivers_df.drop_duplicates("AR_ID")
+        ar_states = pd.Series(
+            ar_states["State"].astype(object).values,
+            index=ar_states["AR_ID"].astype(str).values,
+        )
+
+    science_states = drip_sources.drop_duplicate_rows(
+        dam_science_df, ["science_dam_id"]
+    )
+    science_states = pd.Series(
+        science_states["DamState_Province"].astype(object).values,
+        index=science_states["science_dam_id"].astype(str).values,
+    )
+    science_states = science_states.str.strip().str.lower().map(
+        state_abbreviations
+    ).fillna(science_states)
+
+    states = dams_df["ar_id"].where(
+        dams_df["ar_id"].isna(), dams_df["ar_id"].astype(str)
+    ).map(ar_states)
+    if "science_dam_id" in dams_df.columns:
+        states = states.fillna(dams_df["science_dam_id"].map(science_states))
+    return states.astype(object).str.strip().str.upper()
+
+
+def get_height_classes(dam_height_ft):
+    """Assign dam heights to height classes.
+
+    Parameters
+    ----------
+    dam_height_ft: pandas series
+        dam heights in feet
+
+    Returns
+    ----------
+    classes: pandas series
+        height class labels, unknown for missing heights
+    """
+    heights = pd.to_numeric(dam_height_ft, errors="coerce").values
+    bounds = np.array([bound for bound, _label in height_classes])
+    labels = np.array(
+        [label for _bound, label in height_classes] + [unknown], dtype=object
+    )
+    positions = np.searchsorted(bounds, heights, side="right")
+    positions[np.isnan(heights)] = len(height_classes)
+    return pd.Series(labels[positions], index=dam_height_ft.index)
+
+
+def build_facts(dams_df, accession_df, states=None):
+    """Build one row of dimensions and counts per dam.
+
+    Parameters
+    ----------
+    dams_df: pandas dataframe
+        Return dataframe from bis_pipeline.build_drip_dams_table
+    accession_df: pandas dataframe
+        Return dataframe from
+        drip_sources.get_science_subset(target='Accession')
+    states: pandas series
+        Return series from get_dam_states, None leaves state unknown
+
+    Returns
+    ----------
+    facts: pandas dataframe
+        _id, dimensions and measures of each dam
+    """
+    keys = accession_df[
+        ["science_dam_id", "science_citation_id", "science_results_id"]
+    ].dropna(subset=["science_dam_id"])
+    keys = keys.assign(science_dam_id=keys["science_dam_id"].astype(int)
+                       .astype(str))
+    counts = keys.groupby("science_dam_id").agg(
+        citations=("science_citation_id", "nunique"),
+        results=("science_results_id", "nunique"),
+    )
+
+    if "science_dam_id" in dams_df.columns:
+        science_dam_id = dams_df["science_dam_id"]
+    else:
+        science_dam_id = pd.Series(np.nan, index=dams_df.index)
+
+    if states is None:
+        states = pd.Series(unknown, index=dams_df.index)
+
+    removed_year = pd.to_numeric(dams_df["dam_removed_year"], errors="coerce")
+    facts = pd.DataFrame({
+        "_id": dams_df["_id"].astype(str),
+        "dam_removed_year": removed_year.fillna(unknown_year).astype(int),
+        "state": states.fillna(unknown).astype(str),
+        "height_class": get_height_classes(dams_df["dam_height_ft"]),
+        "dam_source": dams_df["dam_source"].astype(str),
+        "removals": 1,
+        "citations": science_dam_id.map(counts["citations"]).fillna(0)
+        .astype(int),
+        "results": science_dam_id.map(counts["results"]).fillna(0)
+        .astype(int),
+    })
+    return facts.reset_index(drop=True)
+
+
+def aggregate(facts):
+    """Sum measures of fact rows for every combination of dimensions."""
+    return facts.groupby(dimensions, as_index=False)[measures].sum()
+
+
+class SummaryCube:
+    """Removal, citation and result counts by dimension."""
+
+    def __init__(self, facts, cells=None):
+        """Initiate cube.
+
+        Parameters
+        ----------
+        facts: pandas dataframe
+            Return dataframe from build_facts
+        cells: pandas dataframe
+            aggregate of facts, computed when None
+
+        """
+        self.facts = facts
+        self.cells = aggregate(facts) if cells is None else cells
+
+    @classmethod
+    def build(cls, dams_df, accession_df, states=None):
+        """Build cube from the dams table, see build_facts."""
+        return cls(build_facts(dams_df, accession_df, states))
+
+    def slice(self, **filters):
+        """Select cube cells.
+
+        Parameters
+        ----------
+        filters: dict
+            dimension name to a value or list of values to keep,
+            e.g. state='OR', dam_removed_year=[2010, 2011]
+
+        Returns
+        ----------
+        cells: pandas dataframe
+            matching cells
+        """
+        mask = pd.Series(True, index=self.cells.index)
+        for dimension, value in filters.items():
+            if dimension not in dimensions:
+                raise ValueError(
+                    f"Unknown dimension: {dimension}. "
+                    f"Only accepts {dimensions}"
+                )
+            if not isinstance(value, (list, tuple, set)):
+                value = [value]
+            mask &= self.cells[dimension].isin(value)
+        return self.cells[mask]
+
+    def rollup(self, by=None, **filters):
+        """Sum measures over all dimensions not in by.
+
+        Parameters
+        ----------
+        by: list
+            dimensions to keep, None sums everything
+        filters: dict
+            applied first, see slice()
+
+        Returns
+        ----------
+        totals: pandas dataframe
+            measures per combination of by dimensions
+        """
+        cells = self.slice(**filters)
+        if not by:
+            return cells[measures].sum().to_frame().T
+        return cells.groupby(by, as_index=False)[measures].sum()
+
+    def update(self, facts):
+        """Update cube to a new version of the fact table.
+
+        Only dams added, removed or changed since the current fact table
+        are aggregated.
+
+        Parameters
+        ----------
+        facts: pandas dataframe
+            Return dataframe from build_facts for the new dams table
+
+        Returns
+        ----------
+        changes: dict
+            dam ids under 'added', 'removed' and 'changed',
+            see drip_sources.get_changed_rows
+        """
+        changes = drip_sources.get_changed_rows(self.facts, facts, "_id")
+        changes = {k: changes[k] for k in ["added", "removed", "changed"]}
+        old_ids = changes["removed"] + changes["changed"]
+        new_ids = changes["added"] + changes["changed"]
+
+        old = aggregate(self.facts[self.facts["_id"].isin(old_ids)])
+        new = aggregate(facts[facts["_id"].isin(new_ids)])
+        old[measures] = -old[measures]
+
+        cells = pd.concat([self.cells, old, new], ignore_index=True)
+        cells = cells.groupby(dimensions, as_index=False)[measures].sum()
+        self.cells = cells[cells["removals"] != 0].reset_index(drop=True)
+        self.facts = facts
+        return changes
+
+    def save(self, out_dir):
+        """Write cube cells and facts as CSV files in out_dir."""
+        os.makedirs(out_dir, exist_ok=True)
+        self.cells.to_csv(
+            os.path.join(out_dir, "summary_cube.csv"), index=False
+        )
+        self.facts.to_csv(
+            os.path.join(out_dir, "summary_facts.csv"), index=False
+        )
+
+    @classmethod
+    def load(cls, out_dir):
+        """Read cube written by save()."""
+        dtype = {"_id": str, "state": str, "height_class": str,
+                 "dam_source": str}
+        cells = pd.read_csv(
+            os.path.join(out_dir, "summary_cube.csv"),
+            dtype=dtype, keep_default_na=False,
+        )
+        facts = pd.read_csv(
+            os.path.join(out_dir, "summary_facts.csv"),
+            dtype=dtype, keep_default_na=False,
+        )
+        return cls(facts, cells)
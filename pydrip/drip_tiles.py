@@ -0,0 +1,212 @@
+"""Map tiles of dam removals for the Dam Removal Information Portal.
+
+Instead of loading every dam point, the DRIP map can fetch the tiles in
+view.  This module assigns each dam with a geometry (see
+drip_dam.Dam.add_geometry) to quadkey tiles at several zoom levels and
+writes one JSON file per tile with the count, center and points of the
+dams in the tile.
+
+Notes
+----------
+Quadkeys follow the Web Mercator tiling used by Bing Maps.  The quadkey
+of a tile at zoom z is the first z characters of the quadkey of any
+point in it, so quadkeys are computed once at the highest zoom.
+
+Each export keeps a manifest of tile signatures.  A signature is built
+from the row fingerprints of the dams in the tile, and only tiles whose
+signature changed are written again.
+"""
+
+# Import packages
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import drip_sources
+
+# Dam attributes included for each point in a tile
+point_columns = ["_id", "latitude", "longitude", "dam_name",
+                 "dam_removed_year", "dam_source"]
+
+default_zooms = [4, 6, 8, 10]
+
+# Web Mercator latitude limit
+max_latitude = 85.05112878
+
+
+def get_quadkeys(latitude, longitude, zoom):
+    """Get quadkey of the tile holding each point.
+
+    Parameters
+    ----------
+    latitude: pandas series
+        latitudes in decimal degrees
+    longitude: pandas series
+        longitudes in decimal degrees
+    zoom: int
+        zoom level, length of returned quadkeys
+
+    Returns
+    ----------
+    quadkeys: pandas series
+        quadkey strings, same index as latitude
+    """
+    lat = np.clip(latitude.to_numpy(dtype=float), -max_latitude, max_latitude)
+    lon = longitude.to_numpy(dtype=float)
+
+    x = (lon + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)
+
+    size = 2 ** zoom
+    tile_x = np.clip(np.floor(x * size), 0, size - 1).astype(np.int64)
+    tile_y = np.clip(np.floor(y * size), 0, size - 1).astype(np.int64)
+
+    quadkeys = np.full(len(lat), "", dtype=object)
+    for level in range(zoom, 0, -1):
+        bit = 1 << (level - 1)
+        digit = ((tile_x & bit) != 0).astype(int) + 2 * (
+            (tile_y & bit) != 0
+        ).astype(int)
+        quadkeys = quadkeys + digit.astype(str).astype(object)
+    return pd.Series(quadkeys, index=latitude.index, dtype=object)
+
+
+def get_tile_points(dams_df):
+    """Select points of dams with geometry.
+
+    Parameters
+    ----------
+    dams_df: pandas dataframe
+        Return dataframe from bis_pipeline.build_drip_dams_table
+
+    Returns
+    ----------
+    points: pandas dataframe
+        point_columns of dams with geometry and coordinates
+    """
+    points = dams_df[dams_df["geometry"].notna()]
+    points = points[[c for c in point_columns if c in points.columns]]
+    points = points.assign(
+        latitude=pd.to_numeric(points["latitude"], errors="coerce"),
+        longitude=pd.to_numeric(points["longitude"], errors="coerce"),
+    )
+    points = points[points["latitude"].notna() & points["longitude"].notna()]
+    return points.reset_index(drop=True)
+
+
+def get_tile_signatures(tiles, fingerprints):
+    """Summarize fingerprints of the dams in each tile.
+
+    Parameters
+    ----------
+    tiles: pandas series
+        quadkey of each dam
+    fingerprints: pandas series
+        row fingerprint of each dam
+
+    Returns
+    ----------
+    signatures: pandas series
+        text signature per quadkey, independent of dam order
+    """
+    fingerprints = fingerprints.to_numpy(dtype=np.uint64)
+    parts = pd.DataFrame({
+        "tile": tiles.to_numpy(),
+        "count": 1,
+        "high": (fingerprints >> np.uint64(32)).astype(np.int64),
+        "low": (fingerprints & np.uint64(0xFFFFFFFF)).astype(np.int64),
+    }).groupby("tile")[["count", "high", "low"]].sum()
+    return (
+        parts["count"].astype(str) + "-" + parts["high"].astype(str)
+        + "-" + parts["low"].astype(str)
+    )
+
+
+def tile_content(zoom, quadkey, points):
+    """Build JSON content of a tile."""
+    records = points.astype(object).where(points.notna(), None)
+    return {"zoom": zoom,
+            "quadkey": quadkey,
+            "count": len(points),
+            "center": [float(points["longitude"].mean()),
+                       float(points["latitude"].mean())],
+            "points": records.to_dict("records")}
+
+
+def export_tiles(dams_df, out_dir, zooms=None):
+    """Write dam tiles, rewriting only tiles whose dams changed.
+
+    Tiles are written to <out_dir>/<zoom>/<quadkey>.json and the
+    signatures of written tiles to <out_dir>/manifest.json.
+
+    Parameters
+    ----------
+    dams_df: pandas dataframe
+        Return dataframe from bis_pipeline.build_drip_dams_table
+    out_dir: str
+        directory of tile files
+    zooms: list
+        zoom levels to export, default_zooms when None
+
+    Returns
+    ----------
+    summary: dict
+        tile paths 'written' and 'deleted' and number 'unchanged'
+    """
+    zooms = sorted(default_zooms if zooms is None else zooms)
+    if zooms[0] < 1:
+        raise ValueError("Zoom levels must be 1 or greater")
+
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    points = get_tile_points(dams_df)
+    fingerprints = drip_sources.row_fingerprint(points)
+    quadkeys = get_quadkeys(points["latitude"], points["longitude"], zooms[-1])
+
+    new_manifest = {}
+    written = []
+    for zoom in zooms:
+        tiles = quadkeys.str[:zoom]
+        signatures = get_tile_signatures(tiles, fingerprints)
+        paths = pd.Series(
+            [os.path.join(str(zoom), f"{quadkey}.json")
+             for quadkey in signatures.index],
+            index=signatures.index,
+        )
+        new_manifest.update(dict(zip(paths, signatures)))
+
+        changed = [
+            quadkey for quadkey, path in paths.items()
+            if manifest.get(path) != signatures[quadkey]
+        ]
+        if not changed:
+            continue
+        os.makedirs(os.path.join(out_dir, str(zoom)), exist_ok=True)
+        changed_points = points[tiles.isin(changed)]
+        for quadkey, tile_points in changed_points.groupby(
+            tiles[tiles.isin(changed)]
+        ):
+            with open(os.path.join(out_dir, paths[quadkey]), "w") as f:
+                json.dump(tile_content(zoom, quadkey, tile_points), f)
+            written.append(paths[quadkey])
+
+    deleted = [path for path in manifest if path not in new_manifest]
+    for path in deleted:
+        if os.path.exists(os.path.join(out_dir, path)):
+            os.remove(os.path.join(out_dir, path))
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(new_manifest, f, indent=0, sort_keys=True)
+
+    summary = {"written": sorted(written),
+               "deleted": sorted(deleted),
+               "unchanged": len(new_manifest) - len(written)}
+    return summary
@@ -11,6 +11,7 @@ setup(
     url="http://github.com/usgs-bcb/pydrip",
     license="unlicense",
     packages=find_packages(include=['pydrip','pydrip.*']),
+    package_data={"pydrip": ["resources/*.json"]},
     test_suite='tests',
     install_requires=[
         "pandas==1.0.3",
@@ -19,5 +20,8 @@ setup(
         "sciencebasepy==1.6.9",
         "Shapely==1.7.0",
     ],
+    entry_points={
+        "console_scripts": ["pydrip=pydrip.cli:main"],
+    },
     zip_safe=False,
 )
@@ -0,0 +1,29 @@
+"""Small source datasets shared by pydrip tests."""
+
+import io
+
+import pandas as pd
+
+science_csv = """AccessionKey,DamAccessionNumber,CitationAccessionNumber,DesignID,ResultsID,AR_ID,DamName,DamNameAlternate,DamRiverName,DamRiverNameAlternate,DamState_Province,DamLatitude,DamLongitude,DamHeight_m,DamYearBuiltOriginalStructure,DamYearBuiltRemovedStructure,DamYearRemovalFinished,DamNIDID,DesignNumOfDamsRemoved,DesignTypeOfStudy,CitationAuthor,CitationTitle,CitationYear,CitationDOI,ResultsDataQuality,ResultsFishPassage
+1,10,100,1000,5000,A1,Murphy Creek,"Sparrowk Dam,Sparrow",Murphy Creek,,Oregon,44.1,-123.2,3.0,1910,,2005,OR001,1,Case study,Smith J,Fish return,2010,10.1/abc,Good,1
+2,10,101,1001,5001,A1,Murphy Creek,"Sparrowk Dam,Sparrow",Murphy Creek,,Oregon,44.1,-123.2,3.0,1910,,2005,OR001,1,Case study,Jones K,Sediment pulse,,,Fair,0
+3,11,100,1002,5002,,Elwha,,Elwha River,Big River,Washington,48.0,-123.5,32.9,,1913,2012,,2,Review,Smith J,Fish return,2010,10.1/abc,Good,1
+4,12,102,1003,5003,A2,,,,,,,,,1950,,,,1,Case study,Lee M,Unknown dam,1999,,Poor,0
+"""
+
+american_rivers_csv = """AR_ID,Dam_Name,River,State,Latitude,Longitude,Year_Removed,Year_Built,Dam_Height_ft,NID_ID,Unnamed: 10
+A1,Murphy Creek Dam (Sparrow Dam),Murphy Creek,OR,44.1,-123.2,2005,1910,10,OR001,
+A2,Mill Pond Dam,Mill Brook,ME,45.2,-69.1,2001,,12,ME002,
+A3,Upper Dam (Lost Man Dam),Lost Creek,CO,39.5,-105.0,1999,1920,unknown,,
+A4,Russell (Hinkley) Dam,Salmon River,NY,,,2015,1900,8,NY004,
+"""
+
+
+def science_df():
+    """Return sample Dam Removal Science Database."""
+    df = pd.read_csv(io.StringIO(science_csv))
+    return df.rename(columns={"CitationAccessionNumber": "science_citation_id",
+                              "DamAccessionNumber": "science_dam_id",
+                              "DesignID": "science_design_id",
+                              "ResultsID": "science_results_id"})
+
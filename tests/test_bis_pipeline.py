@@ -0,0 +1,190 @@
+"""Tests of bis_pipeline module."""
+
+import asyncio
+import threading
+
+import pandas as pd
+import pytest
+
+from pydrip import bis_pipeline, drip_sources
+from tests import sample_data
+
+
+def test_process_1(local_sources):
+    """Records are sent in table order through the sync contract."""
+    sent = []
+    count = bis_pipeline.process_1("mock", None, sent.append, None, None)
+    assert count == len(sent)
+    assert sent[0]["row_id"] == "dam_removals_10"
+    assert sent[-1]["data"]["dataset"] == "source_datasets"
+    datasets = []
+    for record in sent:
+        if record["data"]["dataset"] not in datasets:
+            datasets.append(record["data"]["dataset"])
+    assert datasets == (
+        ["dam_removals"] + bis_pipeline.tables + ["source_datasets"]
+    )
+
+
+def test_process_1_in_running_loop(local_sources):
+    """Sync wrapper also works when called inside a running event loop."""
+    expected = []
+    bis_pipeline.process_1("mock", None, expected.append, None, None)
+
+    sent = []
+
+    async def main():
+        return bis_pipeline.process_1("mock", None, sent.append, None, None)
+
+    loop = asyncio.new_event_loop()
+    try:
+        count = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    assert count == len(expected)
+    assert [r["row_id"] for r in sent] == [r["row_id"] for r in expected]
+
+
+def test_process_1_async(local_sources, monkeypatch):
+    """Sends run concurrently and overlap with building later tables."""
+    sync_sent = []
+    bis_pipeline.process_1("mock", None, sync_sent.append, None, None)
+
+    events = []
+    first_dam_sent = threading.Event()
+    get_science_subset = drip_sources.get_science_subset
+
+    def blocked_get_science_subset(df, target="Dam"):
+        # first subset table is only built once a dam record was sent
+        if target == bis_pipeline.tables[0]:
+            assert first_dam_sent.wait(timeout=10)
+            events.append("built " + target)
+        return get_science_subset(df, target)
+
+    monkeypatch.setattr(drip_sources, "get_science_subset",
+                        blocked_get_science_subset)
+
+    async_sent = []
+    in_flight = []
+    peak = []
+
+    async def send_final_result(record):
+        in_flight.append(record)
+        peak.append(len(in_flight))
+        if record["data"]["dataset"] == "dam_removals":
+            events.append("sent dam_removals")
+            first_dam_sent.set()
+        await asyncio.sleep(0.001)
+        in_flight.remove(record)
+        async_sent.append(record)
+
+    loop = asyncio.new_event_loop()
+    try:
+        count = loop.run_until_complete(asyncio.wait_for(
+            bis_pipeline.process_1_async(
+                "mock", None, send_final_result, None, None,
+                max_concurrency=4,
+            ),
+            timeout=20,
+        ))
+    finally:
+        loop.close()
+
+    assert count == len(sync_sent)
+    assert (
+        sorted(r["row_id"] for r in async_sent)
+        == sorted(r["row_id"] for r in sync_sent)
+    )
+    assert max(peak) == 4
+    assert events.index("sent dam_removals") < events.index(
+        "built " + bis_pipeline.tables[0]
+    )
+
+
+@pytest.mark.parametrize("function", ["build_drip_dams_table",
+                                      "table_records"])
+def test_process_1_async_build_error(local_sources, monkeypatch, function):
+    """A failing build stops the run with the build error."""
+    def failing_build(*args, **kwargs):
+        raise ValueError("build failed")
+
+    monkeypatch.setattr(bis_pipeline, function, failing_build)
+
+    async def send_final_result(record):
+        pass
+
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(ValueError):
+            loop.run_until_complete(asyncio.wait_for(
+                bis_pipeline.process_1_async(
+                    "mock", None, send_final_result, None, None
+                ),
+                timeout=20,
+            ))
+    finally:
+        loop.close()
+
+
+def test_process_1_build_error(local_sources, monkeypatch):
+    """Sync wrapper raises a failing subset build."""
+    get_science_subset = drip_sources.get_science_subset
+
+    def failing_get_science_subset(df, target="Dam"):
+        if target == "Design":
+            raise ValueError("build failed")
+        return get_science_subset(df, target)
+
+    monkeypatch.setattr(drip_sources, "get_science_subset",
+                        failing_get_science_subset)
+    sent = []
+    with pytest.raises(ValueError):
+        bis_pipeline.process_1("mock", None, sent.append, None, None)
+    assert sent
+
+
+def test_process_1_async_send_error(local_sources):
+    """A failing send stops the run with the send error."""
+    async def send_final_result(record):
+        raise RuntimeError("send failed")
+
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(RuntimeError):
+            loop.run_until_complete(bis_pipeline.process_1_async(
+                "mock", None, send_final_result, None, None
+            ))
+    finally:
+        loop.close()
+
+
+def test_build_drip_dams_table_categorical(dams_df, american_rivers_df):
+    """Categorical build holds the same values as the plain build."""
+    science_df = drip_sources.encode_categories(
+        sample_data.science_df(), drip_sources.science_categorical_columns
+    )
+    ar_df = drip_sources.encode_categories(
+        american_rivers_df, drip_sources.american_rivers_categorical_columns,
+    )
+    encoded = bis_pipeline.build_drip_dams_table(
+        science_df, ar_df, categorical=True
+    )
+    assert encoded["dam_source"].dtype.name == "category"
+    pd.testing.assert_frame_equal(
+        encoded.astype(object), dams_df.astype(object)
+    )
+
+
+def test_build_drip_dams_table_projected(local_sources):
+    """Dams table built from its column groups matches full read."""
+    american_rivers_df, science_df, _source_datasets = bis_pipeline.get_data()
+    _ar_df, projected_df, _source_datasets = bis_pipeline.get_data(
+        groups=bis_pipeline.dams_table_column_groups
+    )
+    assert len(projected_df.columns) < len(science_df.columns)
+    pd.testing.assert_frame_equal(
+        bis_pipeline.build_drip_dams_table(projected_df, american_rivers_df)
+        .astype(object),
+        bis_pipeline.build_drip_dams_table(science_df, american_rivers_df)
+        .astype(object),
+    )
@@ -0,0 +1,111 @@
+"""Tests of cli module."""
+
+import os
+import pstats
+
+import pandas as pd
+import pytest
+
+from pydrip import cli, drip_summary
+from tests import sample_data
+
+
+@pytest.fixture
+def source_args(sample_sources):
+    """Arguments pointing at local copies of the sample data."""
+    return ["--ar-file", sample_sources["american_rivers"],
+            "--science-file", sample_sources["science"]]
+
+
+def test_build(source_args, tmp_path):
+    """Build writes one table per dataset."""
+    out_dir = str(tmp_path / "out")
+    assert cli.main(["build", "--out-dir", out_dir] + source_args) == 0
+    dams = pd.read_csv(os.path.join(out_dir, "dam_removals.csv"))
+    assert list(dams["_id"].astype(str)) == ["10", "11", "12", "A3", "A4"]
+    assert os.path.exists(os.path.join(out_dir, "DamCitations.csv"))
+    assert os.path.exists(os.path.join(out_dir, "source_datasets.csv"))
+
+
+def test_export(source_args, tmp_path):
+    """Export writes tiles, citation lookup, summary cube and report."""
+    out_dir = str(tmp_path / "out")
+    cli.main(["export", "--out-dir", out_dir, "--zooms", "2", "4"]
+             + source_args)
+    assert os.path.exists(os.path.join(out_dir, "tiles", "manifest.json"))
+    assert os.path.exists(os.path.join(out_dir, "dam_citations.json.gz"))
+    assert os.path.exists(
+        os.path.join(out_dir, "summary", "summary_cube.csv")
+    )
+    assert os.path.exists(os.path.join(out_dir, "quality_report.csv"))
+
+
+def test_export_updates_summary(source_args, sample_sources, tmp_path,
+                                capsys):
+    """A second export updates the saved summary cube in place."""
+    out_dir = str(tmp_path / "out")
+    args = ["export", "--out-dir", out_dir, "--zooms", "2"] + source_args
+    cli.main(args)
+    summary_dir = os.path.join(out_dir, "summary")
+    first = drip_summary.SummaryCube.load(summary_dir)
+    capsys.readouterr()
+
+    cli.main(args)
+    assert "Summary dams added: 0, removed: 0, changed: 0" in (
+        capsys.readouterr().out
+    )
+    second = drip_summary.SummaryCube.load(summary_dir)
+    pd.testing.assert_frame_equal(first.cells, second.cells)
+
+    # a dam removed in another year is re-aggregated
+    with open(sample_sources["american_rivers"], "w") as f:
+        f.write(sample_data.american_rivers_csv.replace(",2015,", ",2016,"))
+    cli.main(args)
+    assert "changed: 1" in capsys.readouterr().out
+    updated = drip_summary.SummaryCube.load(summary_dir)
+    pd.testing.assert_frame_equal(
+        updated.cells, drip_summary.aggregate(updated.facts)
+    )
+    assert 2016 in updated.cells["dam_removed_year"].values
+
+
+@pytest.mark.parametrize("profiler", ["sample", "cprofile"])
+def test_benchmark_profile(source_args, tmp_path, profiler):
+    """Benchmark reports stage timings and writes a profile."""
+    out_dir = str(tmp_path / "out")
+    profile = str(tmp_path / "run.profile")
+    cli.main(["benchmark", "--repeat", "2", "--out-dir", out_dir,
+              "--profile", profile, "--profiler", profiler] + source_args)
+    report = pd.read_csv(os.path.join(out_dir, "benchmark.csv"))
+    assert "build_drip_dams_table" in list(report["stage"])
+    assert os.path.getsize(profile) > 0
+
+
+def test_build_cprofile(source_args, tmp_path):
+    """cProfile stats of a build include the table building stages."""
+    out_dir = str(tmp_path / "out")
+    profile = str(tmp_path / "build.profile")
+    cli.main(["build", "--out-dir", out_dir, "--profile", profile,
+              "--profiler", "cprofile"] + source_args)
+    functions = {
+        function for _file, _line, function in pstats.Stats(profile).stats
+    }
+    assert "build_drip_dams_table" in functions
+    assert "get_science_subset" in functions
+    assert "read_csv" in functions
+
+
+def test_source_arguments_exclusive(source_args):
+    """A source is either pinned by url or read from a file."""
+    with pytest.raises(SystemExit):
+        cli.main(["build", "--ar-url", "http://127.0.0.1/ar.csv"]
+                 + source_args)
+
+
+def test_fetch(source_args, tmp_path):
+    """Fetch writes source files and their description."""
+    out_dir = str(tmp_path / "sources")
+    cli.main(["fetch", "--out-dir", out_dir] + source_args)
+    with open(os.path.join(out_dir, "american_rivers.csv")) as f:
+        assert f.read() == sample_data.american_rivers_csv
+    assert os.path.exists(os.path.join(out_dir, "source_datasets.json"))
@@ -0,0 +1,159 @@
+"""Tests of drip_checkpoint module."""
+
+import os
+
+import pytest
+
+from pydrip import bis_pipeline, drip_checkpoint, drip_replay, drip_sources
+
+
+def test_emission_ledger(tmp_path):
+    """Offset only passes records once all earlier ones are acknowledged."""
+    store = drip_checkpoint.CheckpointStore(str(tmp_path))
+    ledger = drip_checkpoint.EmissionLedger(store, "run", save_every=2)
+    ledger.ack(1)
+    assert ledger.offset == 0
+    ledger.ack(0)
+    assert ledger.offset == 2
+    assert store.load_offset("run") == 2
+    ledger.ack(2)
+    assert store.load_offset("run") == 2
+    ledger.save()
+    assert drip_checkpoint.EmissionLedger(store, "run").offset == 3
+    ledger.complete()
+    assert store.load_offset("run") == 0
+
+
+def test_cached(tmp_path):
+    """Stage is built once per key."""
+    store = drip_checkpoint.CheckpointStore(str(tmp_path))
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"built": len(builds)}
+
+    assert store.cached("stage", "a", build) == {"built": 1}
+    assert store.cached("stage", "a", build) == {"built": 1}
+    assert store.cached("stage", "b", build) == {"built": 2}
+
+
+def test_resume_process_1(local_sources, tmp_path, monkeypatch):
+    """Rerun skips downloads and continues after acknowledged records."""
+    expected = []
+    bis_pipeline.process_1("mock", None, expected.append, None, None)
+
+    downloads = []
+    get_source_content = drip_sources.get_source_content
+
+    def counted_get_source_content(file_url):
+        # reads of checkpointed copies are not downloads
+        if not file_url.startswith(token["checkpoint_dir"]):
+            downloads.append(file_url)
+        return get_source_content(file_url)
+
+    token = {"checkpoint_dir": str(tmp_path / "work")}
+    monkeypatch.setattr(drip_sources, "get_source_content",
+                        counted_get_source_content)
+    sent = []
+
+    def failing_send(record):
+        if len(sent) == 5:
+            raise RuntimeError("send failed")
+        sent.append(record)
+
+    with pytest.raises(RuntimeError):
+        bis_pipeline.process_1("mock", None, failing_send, None, token)
+    assert len(downloads) == 2
+
+    count = bis_pipeline.process_1("mock", None, sent.append, None, token)
+    assert len(downloads) == 2
+    assert count == len(expected)
+    assert [r["row_id"] for r in sent] == [r["row_id"] for r in expected]
+
+    # completed run starts from the first record again
+    rerun = []
+    bis_pipeline.process_1("mock", None, rerun.append, None, token)
+    assert len(rerun) == len(expected)
+
+
+def test_get_source_changed(tmp_path):
+    """A changed local source is copied again with a new digest."""
+    source = tmp_path / "ar.csv"
+    source.write_text("AR_ID,Dam_Name\n1,Upper Dam\n")
+    store = drip_checkpoint.CheckpointStore(str(tmp_path / "work"))
+    path, digest = store.get_source(str(source))
+
+    source.write_text("AR_ID,Dam_Name\n1,Lower Dam\n")
+    os.utime(source, ns=(0, source.stat().st_mtime_ns + 10 ** 9))
+    new_path, new_digest = store.get_source(str(source))
+    assert new_digest != digest
+    with open(new_path) as f:
+        assert "Lower Dam" in f.read()
+
+
+def test_get_source_unversioned_url(tmp_path):
+    """Urls without version headers are keyed by content digest."""
+    source_dir = tmp_path / "sources"
+    source_dir.mkdir()
+    source = source_dir / "ar.csv"
+    source.write_text("AR_ID,Dam_Name\n1,Upper Dam\n")
+    store = drip_checkpoint.CheckpointStore(str(tmp_path / "work"))
+
+    # the stub server refuses HEAD requests
+    with drip_replay.StubSourceServer(str(source_dir)) as server:
+        url = server.url_for("ar.csv")
+        assert drip_sources.get_source_version(url) is None
+        path, digest = store.get_source(url)
+        assert store.get_source(url) == (path, digest)
+
+        source.write_text("AR_ID,Dam_Name\n1,Lower Dam\n")
+        new_path, new_digest = store.get_source(url)
+    assert new_digest != digest
+    with open(new_path) as f:
+        assert "Lower Dam" in f.read()
+
+
+def test_fingerprint_pydrip_version(monkeypatch):
+    """Checkpoint keys change with the pydrip version."""
+    key = drip_checkpoint.fingerprint("digest", True)
+    monkeypatch.setattr(drip_checkpoint, "pydrip_version", "next")
+    assert drip_checkpoint.fingerprint("digest", True) != key
+
+
+def test_resume_failed_build(local_sources, tmp_path, monkeypatch):
+    """Rerun after a failed build stage keeps completed stages."""
+    expected = []
+    bis_pipeline.process_1("mock", None, expected.append, None, None)
+
+    token = {"checkpoint_dir": str(tmp_path / "work")}
+    dam_builds = []
+    build_drip_dams_table = bis_pipeline.build_drip_dams_table
+
+    def counted_build_drip_dams_table(*args):
+        dam_builds.append(1)
+        return build_drip_dams_table(*args)
+
+    get_science_subset = drip_sources.get_science_subset
+
+    def failing_get_science_subset(df, target="Dam"):
+        if target == "Design":
+            raise ValueError("build failed")
+        return get_science_subset(df, target)
+
+    monkeypatch.setattr(bis_pipeline, "build_drip_dams_table",
+                        counted_build_drip_dams_table)
+    monkeypatch.setattr(drip_sources, "get_science_subset",
+                        failing_get_science_subset)
+    sent = []
+    with pytest.raises(ValueError):
+        bis_pipeline.process_1("mock", None, sent.append, None, token)
+    assert sent
+    assert dam_builds == [1]
+
+    monkeypatch.setattr(drip_sources, "get_science_subset",
+                        get_science_subset)
+    count = bis_pipeline.process_1("mock", None, sent.append, None, token)
+    assert dam_builds == [1]
+    assert count == len(expected)
+    assert [r["row_id"] for r in sent] == [r["row_id"] for r in expected]
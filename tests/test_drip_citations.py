@@ -0,0 +1,47 @@
+"""Tests of drip_citations module."""
+
+from pydrip import drip_citations, drip_sources
+from tests import sample_data
+
+
+def test_build_matches_dam_citations():
+    """Index holds the same citations as the DamCitations subset."""
+    science_df = sample_data.science_df()
+    index = drip_citations.DamCitationIndex.build(science_df)
+    subset = drip_sources.get_science_subset(science_df, "DamCitations")
+
+    for dam_id, citations in subset.groupby("dam_science_id"):
+        dois = citations["citation_doi"].astype(object)
+        dois = dois.where(dois.notna(), None)
+        expected = set(zip(citations["citation"], dois))
+        found = set((c.citation, c.doi) for c in index.get(dam_id))
+        assert found == expected
+    assert len(index) == subset["dam_science_id"].nunique()
+
+
+def test_get():
+    """Citations are ordered by year with results ids per citation."""
+    index = drip_citations.DamCitationIndex.build(sample_data.science_df())
+    citations = index.get("10")
+    assert [c.science_citation_id for c in citations] == [100, 101]
+    assert citations[0] == drip_citations.DamCitation(
+        citation="Smith J, 2010, Fish return",
+        doi="https://doi.org/10.1/abc",
+        year=2010,
+        science_citation_id=100,
+        science_results_ids=[5000],
+    )
+    assert citations[1].doi is None
+    assert citations[1].year is None
+    assert index.get(10) == citations
+    assert index.get("999") == []
+
+
+def test_save_load(tmp_path):
+    """Saved index loads with the same lookups."""
+    index = drip_citations.DamCitationIndex.build(sample_data.science_df())
+    path = str(tmp_path / "dam_citations.json.gz")
+    index.save(path)
+    loaded = drip_citations.DamCitationIndex.load(path)
+    for dam_id in ["10", "11", "12"]:
+        assert loaded.get(dam_id) == index.get(dam_id)
@@ -1,6 +1,9 @@
 """Tests of drip_sources module."""
 
-from pydrip import drip_dam
+import pandas as pd
+
+from pydrip import drip_dam, drip_sources
+from tests import sample_data
 
 test_dam = drip_dam.Dam(dam_id=1)
 
@@ -47,3 +50,79 @@ def test_add_geometry():
     test_dam.longitude = -90.25
     test_dam.add_geometry()
     assert test_dam.geometry == 'POINT (-90.25 40.25)'
+
+
+def test_science_data():
+    """Test dam attributes from coerced science data."""
+    dam_df = drip_sources.coerce_science_dam_data(
+        drip_sources.get_science_subset(sample_data.science_df(), "Dam")
+    )
+    dams = {}
+    for dam in dam_df.itertuples():
+        science_dam = drip_dam.Dam(dam_id=dam.science_dam_id)
+        science_dam.science_data(dam)
+        dams[science_dam._id] = science_dam
+
+    assert dams['10'].dam_height_ft == 9
+    assert dams['10'].dam_alt_name == ['sparrowk dam', 'sparrow']
+    assert dams['10'].ar_id == 'A1'
+    assert dams['11'].dam_built_year == 1913
+    assert dams['11'].dam_removed_year == 2012
+    assert dams['11'].stream_alt_name == ['big river']
+    assert dams['11'].ar_id is None
+    assert dams['12'].latitude is None
+    assert dams['12'].dam_name is None
+    assert dams['12'].dam_height_ft is None
+    assert dams['12'].dam_removed_year is None
+
+    # alt names are copied so source table is left unchanged
+    dams['10'].dam_alt_name.append('new name')
+    assert dam_df['DamNameAlternate'][0] == ['sparrowk dam', 'sparrow']
+
+
+def test_science_data_uncoerced():
+    """Uncoerced rows are coerced before setting attributes."""
+    dam_science_df = drip_sources.get_science_subset(
+        sample_data.science_df(), "Dam"
+    )
+    coerced_df = drip_sources.coerce_science_dam_data(dam_science_df)
+    for dam, coerced in zip(dam_science_df.itertuples(),
+                            coerced_df.itertuples()):
+        raw_dam = drip_dam.Dam(dam_id=dam.science_dam_id)
+        raw_dam.science_data(dam)
+        series_dam = drip_dam.Dam(dam_id=dam.science_dam_id)
+        series_dam.science_data(dam_science_df.loc[dam.Index])
+        coerced_dam = drip_dam.Dam(dam_id=coerced.science_dam_id)
+        coerced_dam.science_data(coerced)
+        assert raw_dam.__dict__ == coerced_dam.__dict__
+        assert series_dam.__dict__ == coerced_dam.__dict__
+
+
+def test_clean_names():
+    """Vectorized name cleaning matches clean_name."""
+    names = pd.Series(['Upper Dam (Lost Man Dam)',
+                       'Russell (Hinkley) Dam',
+                       'Glenbrook/ Anadromous Fish Habitat Restoration',
+                       'Mill ) Pond (Upper',
+                       'Twin (North (Old)) Dam',
+                       'Plain Dam'])
+    main_names, alt_names = drip_dam.clean_names(names)
+    for name, main_name, alt_name in zip(names, main_names, alt_names):
+        assert (main_name, alt_name) == drip_dam.clean_name(name)
+
+
+def test_build_ar_dams_table(american_rivers_df):
+    """Vectorized AR dams match Dam objects built from AR data."""
+    ar_df = american_rivers_df
+    expected = []
+    for dam in ar_df.itertuples():
+        ar_dam = drip_dam.Dam(dam_id=dam.AR_ID, dam_source="American Rivers")
+        ar_dam.ar_dam_data(dam)
+        ar_dam.add_geometry()
+        expected.append(ar_dam.__dict__)
+    expected = pd.DataFrame(expected)
+
+    ar_dams = drip_dam.build_ar_dams_table(ar_df)
+    pd.testing.assert_frame_equal(
+        ar_dams.astype(object), expected[ar_dams.columns].astype(object)
+    )
@@ -0,0 +1,44 @@
+"""Tests of drip_quality module."""
+
+from pydrip import drip_quality
+
+
+def flagged(report, rule):
+    """Ids of dams flagged by rule."""
+    return sorted(report.loc[report["rule"] == rule, "_id"])
+
+
+def test_evaluate_rules(dams_df, american_rivers_df):
+    """Quality rules flag records of the merged dams table."""
+    dams_df = dams_df.reset_index(drop=True)
+    ids = list(dams_df["_id"])
+    dams_df.loc[ids.index("11"), "dam_built_year"] = 2020
+    dams_df.loc[ids.index("A3"), "longitude"] = 105.0
+    dams_df.loc[ids.index("12"), "dam_height_ft"] = 39
+    dams_df.loc[ids.index("10"), "dam_removed_year"] = 2004
+
+    report = drip_quality.evaluate_rules(
+        dams_df, american_rivers_df=american_rivers_df
+    )
+    assert flagged(report, "removed_before_built") == ["11"]
+    assert flagged(report, "outside_us") == ["A3"]
+    assert flagged(report, "height_unit_mismatch") == ["12"]
+    assert flagged(report, "removal_year_conflict") == ["10"]
+    assert flagged(report, "name_conflict") == ["10"]
+    assert flagged(report, "height_out_of_range") == []
+    assert set(report["severity"]) <= {"error", "warning"}
+
+
+def test_rules_without_american_rivers(dams_df):
+    """Rules needing American Rivers values are skipped without them."""
+    report = drip_quality.evaluate_rules(dams_df)
+    assert "height_unit_mismatch" not in set(report["rule"])
+
+
+def test_custom_rule(dams_df):
+    """Rules are plain dicts."""
+    rules = [{"name": "tall", "type": "range",
+              "column": "dam_height_ft", "max": 100}]
+    report = drip_quality.evaluate_rules(dams_df, rules)
+    assert flagged(report, "tall") == ["11"]
+    assert report["severity"].tolist() == ["warning"]
@@ -0,0 +1,110 @@
+"""Tests of drip_replay module."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from pydrip import drip_replay, drip_sources
+
+ar_csv = (
+    "AR_ID,Dam_Name,Year_Removed,Year_Built,Dam_Height_ft,Unnamed: 9\n"
+    "1,Upper Dam (Lost Man Dam),2001,1900,12,\n"
+    "2,Russell Dam,unknown,,8.5,\n"
+)
+
+
+def test_record_then_replay(tmp_path):
+    """Record a download from the stub server and replay it offline."""
+    source_dir = tmp_path / "sources"
+    source_dir.mkdir()
+    (source_dir / "ar.csv").write_text(ar_csv)
+    fixture_dir = str(tmp_path / "fixtures")
+
+    with drip_replay.StubSourceServer(str(source_dir), chunk_size=16) as server:
+        url = server.url_for("ar.csv")
+        with drip_replay.HttpRecorder(fixture_dir, mode="record"):
+            recorded = drip_sources.read_american_rivers(url)
+        assert server.requests_served == 1
+
+    # server is stopped, response must come from fixtures
+    with drip_replay.HttpRecorder(fixture_dir, mode="replay") as recorder:
+        replayed = drip_sources.read_american_rivers(url)
+    assert recorder.calls[0]["url"] == url
+    assert replayed.equals(recorded)
+    assert list(replayed.columns) == [
+        "AR_ID", "Dam_Name", "Year_Removed", "Year_Built", "Dam_Height_ft"
+    ]
+
+
+def test_replay_miss(tmp_path):
+    """Requests without fixtures fail instead of reaching the network."""
+    with drip_replay.HttpRecorder(str(tmp_path), mode="replay"):
+        with pytest.raises(drip_replay.ReplayMissError):
+            drip_sources.get_source_content("http://127.0.0.1:9/missing.csv")
+
+
+def test_nested_recorders(tmp_path):
+    """Uninstalling a recorder restores the one installed before it."""
+    outer = drip_replay.HttpRecorder(str(tmp_path / "outer"), mode="replay")
+    outer.install()
+    try:
+        with drip_replay.HttpRecorder(str(tmp_path / "inner"), mode="live"):
+            pass
+        with pytest.raises(drip_replay.ReplayMissError):
+            requests.get("https://example.invalid/source.csv")
+    finally:
+        outer.uninstall()
+
+
+def test_replay_stream(tmp_path):
+    """Replayed responses can be streamed and closed."""
+    source_dir = tmp_path / "sources"
+    source_dir.mkdir()
+    (source_dir / "ar.csv").write_text(ar_csv)
+    fixture_dir = str(tmp_path / "fixtures")
+
+    with drip_replay.StubSourceServer(str(source_dir), chunk_size=16) as server:
+        url = server.url_for("ar.csv")
+        with drip_replay.HttpRecorder(fixture_dir, mode="record"):
+            requests.get(url)
+
+    with drip_replay.HttpRecorder(fixture_dir, mode="replay"):
+        response = requests.get(url, stream=True)
+        assert b"".join(response.iter_content(8)) == ar_csv.encode()
+        assert list(response.iter_lines())[1].startswith(b"1,Upper Dam")
+        response.close()
+
+
+def test_record_uses_previous_send(tmp_path, monkeypatch):
+    """Record mode sends through whatever was installed before it."""
+    source_dir = tmp_path / "sources"
+    source_dir.mkdir()
+    (source_dir / "ar.csv").write_text(ar_csv)
+    seen = []
+    send = requests.Session.send
+
+    def patched_send(session, request, **kwargs):
+        seen.append(request.url)
+        return send(session, request, **kwargs)
+
+    monkeypatch.setattr(requests.Session, "send", patched_send)
+    with drip_replay.StubSourceServer(str(source_dir)) as server:
+        url = server.url_for("ar.csv")
+        with drip_replay.HttpRecorder(str(tmp_path / "fixtures"),
+                                      mode="record"):
+            requests.get(url)
+    assert seen == [url]
+
+
+def test_requests_served_concurrently(tmp_path):
+    """Served requests are counted across handler threads."""
+    source_dir = tmp_path / "sources"
+    source_dir.mkdir()
+    (source_dir / "ar.csv").write_text(ar_csv)
+
+    with drip_replay.StubSourceServer(str(source_dir)) as server:
+        url = server.url_for("ar.csv")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _i: requests.get(url), range(32)))
+    assert server.requests_served == 32
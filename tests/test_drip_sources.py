@@ -1,23 +1,41 @@
 """Tests of drip_sources module."""
 
-from pydrip import drip_sources
+import os
+
+import pandas as pd
+import pytest
+
+from pydrip import drip_replay, drip_sources
 import validators
+from tests import sample_data
+
 
-science_url = drip_sources.get_science_data_url()
-ar_url = drip_sources.get_american_rivers_data_url()
+@pytest.fixture(scope="module")
+def science_url():
+    """Url of newest Dam Removal Science Database."""
+    return drip_sources.get_science_data_url()
 
 
-def test_get_science_data_url():
+@pytest.fixture(scope="module")
+def ar_url():
+    """Url of newest American Rivers Dam Removal Database."""
+    return drip_sources.get_american_rivers_data_url()
+
+
+@pytest.mark.network
+def test_get_science_data_url(science_url):
     """Validate a url is returned."""
     assert validators.url(science_url)
 
 
-def test_get_american_rivers_data_url():
+@pytest.mark.network
+def test_get_american_rivers_data_url(ar_url):
     """Validate a url is returned."""
     assert validators.url(ar_url)
 
 
-def test_read_american_rivers():
+@pytest.mark.network
+def test_read_american_rivers(ar_url):
     """Validate schema and df shape.
 
     This test needs to be expanded to validate schema.
@@ -30,7 +48,8 @@ def test_read_american_rivers():
     assert ar_df.shape[0] >= 1699
 
 
-def test_read_science_data():
+@pytest.mark.network
+def test_read_science_data(science_url):
     """Validate schema and df shape.
 
     This test needs to be expanded to validate schema.
@@ -41,3 +60,112 @@ def test_read_science_data():
     science_df = drip_sources.read_science_data(science_url)
     # v3 had 483 records
     assert science_df.shape[0] >= 483
+
+
+def test_category_memory_report():
+    """Encoded columns report less memory than plain columns."""
+    df = sample_data.science_df()
+    df = pd.concat([df] * 50, ignore_index=True)
+    encoded = drip_sources.encode_categories(df, ["DamState_Province"])
+    assert encoded["DamState_Province"].dtype.name == "category"
+
+    report = drip_sources.category_memory_report(
+        encoded, ["DamState_Province", "CitationAuthor", "not_a_column"]
+    )
+    assert list(report["column"]) == [
+        "DamState_Province", "CitationAuthor", "total"
+    ]
+    assert (report["encoded_bytes"] < report["plain_bytes"]).all()
+
+
+def test_drop_duplicate_rows():
+    """Fingerprint dedup matches pandas drop_duplicates."""
+    df = sample_data.science_df()
+    for columns in [None, ["science_dam_id", "DamName"], ["CitationTitle"]]:
+        expected = df.drop_duplicates(subset=columns)
+        pd.testing.assert_frame_equal(
+            drip_sources.drop_duplicate_rows(df, columns), expected
+        )
+
+
+def test_drop_duplicate_rows_collision(monkeypatch):
+    """Rows sharing a fingerprint are only dropped when values match."""
+    df = pd.DataFrame({"name": ["a", "b", "a"], "alt": [["x"], ["y"], ["x"]]})
+    monkeypatch.setattr(
+        drip_sources, "row_fingerprint",
+        lambda df, columns=None, list_columns=None: pd.Series(
+            0, index=df.index, dtype="uint64"
+        ),
+    )
+    assert list(drip_sources.drop_duplicate_rows(df).index) == [0, 1]
+
+
+def test_get_changed_rows():
+    """Find added, removed and changed rows between versions."""
+    old_df = pd.DataFrame({"id": [1, 2, 3],
+                           "name": ["a", "b", "c"],
+                           "alt": [["x"], [], ["y"]]})
+    new_df = pd.DataFrame({"id": [2, 3, 4],
+                           "name": ["b", "c", "d"],
+                           "alt": [[], ["z"], []]})
+    changes = drip_sources.get_changed_rows(old_df, new_df, "id")
+    assert changes == {"added": [4], "removed": [1], "changed": [3],
+                       "added_columns": [], "removed_columns": []}
+    assert drip_sources.row_fingerprint(new_df).dtype == "uint64"
+
+    with pytest.raises(ValueError):
+        drip_sources.get_changed_rows(
+            old_df, pd.concat([new_df, new_df]), "id"
+        )
+
+    # schema change compares shared columns and reports the others
+    new_df = new_df.drop(columns="alt").assign(extra=[1, 2, 3])
+    changes = drip_sources.get_changed_rows(old_df, new_df, "id")
+    assert changes == {"added": [4], "removed": [1], "changed": [],
+                       "added_columns": ["extra"],
+                       "removed_columns": ["alt"]}
+
+
+def test_read_science_subset(tmp_path):
+    """Projected reads match subsets of the full read, download once."""
+    # identifiers that look numeric are still read as schema strings
+    science_csv = (
+        sample_data.science_csv.replace(",A1,", ",101,")
+        .replace(",A2,", ",0102,").replace("OR001", "1")
+        .replace("10.1/abc", "10.10")
+    )
+    science_path = tmp_path / "science.csv"
+    science_path.write_text(science_csv)
+    full_df = drip_sources.read_science_data(str(science_path))
+    assert list(full_df["AR_ID"].dropna().unique()) == ["101", "0102"]
+    assert full_df["CitationDOI"].iloc[0] == "10.10"
+
+    for target in drip_sources.subset_column_groups:
+        subset_df = drip_sources.read_science_subset(
+            str(science_path), target
+        )
+        pd.testing.assert_frame_equal(
+            subset_df.reset_index(drop=True),
+            drip_sources.get_science_subset(full_df, target)
+            .reset_index(drop=True),
+        )
+
+    with drip_replay.StubSourceServer(str(tmp_path)) as server:
+        with drip_sources.ScienceSource(
+            server.url_for("science.csv")
+        ) as science_source:
+            dam_df = science_source.read(["Dam"])
+            assert len(dam_df.columns) < len(full_df.columns)
+            assert "science_dam_id" in dam_df.columns
+            assert "CitationTitle" not in dam_df.columns
+            science_source.read(["Citation"])
+            assert server.requests_served == 1
+            # the download is spooled to a local file, not kept in memory
+            spooled = science_source.path
+            assert os.path.exists(spooled)
+        assert not os.path.exists(spooled)
+
+    # a new source object reads the rewritten file
+    science_path.write_text(science_csv.replace("Elwha", "Glines"))
+    dam_df = drip_sources.ScienceSource(str(science_path)).read(["Dam"])
+    assert "Glines" in dam_df["DamName"].values
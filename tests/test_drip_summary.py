@@ -0,0 +1,74 @@
+"""Tests of drip_summary module."""
+
+import pandas as pd
+import pytest
+
+from pydrip import drip_sources, drip_summary
+from tests import sample_data
+
+
+@pytest.fixture
+def cube(dams_df, american_rivers_df):
+    """Cube built from sample data."""
+    science_df = sample_data.science_df()
+    dam_science_df = drip_sources.get_science_subset(science_df, "Dam")
+    accession_df = drip_sources.get_science_subset(science_df, "Accession")
+    states = drip_summary.get_dam_states(
+        dams_df, dam_science_df, american_rivers_df
+    )
+    return drip_summary.SummaryCube.build(dams_df, accession_df, states)
+
+
+def test_height_classes():
+    """Heights fall in classes by upper bound."""
+    heights = pd.Series([0, 5, 9.9, 107, None])
+    classes = drip_summary.get_height_classes(heights)
+    assert list(classes) == [
+        "<5 ft", "5-10 ft", "5-10 ft", ">100 ft", "unknown"
+    ]
+
+
+def test_build(cube):
+    """Cube counts removals, citations and results by dimension."""
+    facts = cube.facts.set_index("_id")
+    assert facts.loc["10", "state"] == "OR"
+    assert facts.loc["11", "state"] == "WA"
+    assert facts.loc["12", "state"] == "ME"
+    assert facts.loc["10", "citations"] == 2
+    assert facts.loc["11", "results"] == 1
+    assert facts.loc["A3", "citations"] == 0
+
+    assert cube.rollup()["removals"][0] == len(cube.facts)
+    by_source = cube.rollup(["dam_source"]).set_index("dam_source")
+    assert by_source.loc["Dam Removal Science", "citations"] == 4
+    assert cube.slice(state="WA")["dam_removed_year"].tolist() == [2012]
+    assert cube.rollup(["state"], dam_removed_year=[2005, 2012])[
+        "state"
+    ].tolist() == ["OR", "WA"]
+
+
+def test_update(cube):
+    """Incremental update matches a full rebuild."""
+    facts = cube.facts.copy()
+    facts.loc[facts["_id"] == "10", "dam_removed_year"] = 2006
+    facts = facts[facts["_id"] != "11"]
+    added = facts.iloc[[0]].assign(_id="new")
+    facts = pd.concat([facts, added], ignore_index=True)
+
+    changes = cube.update(facts)
+    assert changes == {"added": ["new"], "removed": ["11"], "changed": ["10"]}
+    expected = drip_summary.aggregate(facts)
+    pd.testing.assert_frame_equal(
+        cube.cells.sort_values(drip_summary.dimensions)
+        .reset_index(drop=True),
+        expected.sort_values(drip_summary.dimensions)
+        .reset_index(drop=True),
+    )
+
+
+def test_save_load(cube, tmp_path):
+    """Saved cube loads with the same cells."""
+    cube.save(str(tmp_path / "summary"))
+    loaded = drip_summary.SummaryCube.load(str(tmp_path / "summary"))
+    pd.testing.assert_frame_equal(loaded.cells, cube.cells)
+    pd.testing.assert_frame_equal(loaded.facts, cube.facts)
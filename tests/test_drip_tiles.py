@@ -0,0 +1,58 @@
+"""Tests of drip_tiles module."""
+
+import json
+import os
+
+import pandas as pd
+
+from pydrip import drip_tiles
+
+
+def test_get_quadkeys():
+    """Quadkeys of known points."""
+    latitude = pd.Series([0.0, 47.61, -33.87])
+    longitude = pd.Series([0.0, -122.33, 151.21])
+    quadkeys = drip_tiles.get_quadkeys(latitude, longitude, 3)
+    assert list(quadkeys) == ["300", "021", "311"]
+    # lower zoom quadkeys are prefixes
+    assert list(drip_tiles.get_quadkeys(latitude, longitude, 1)) == [
+        "3", "0", "3"
+    ]
+
+
+def test_export_tiles(dams_df, tmp_path):
+    """Rebuild only rewrites tiles of changed dams."""
+    out_dir = str(tmp_path / "tiles")
+    summary = drip_tiles.export_tiles(dams_df, out_dir, zooms=[2, 6])
+    assert summary["deleted"] == []
+    assert summary["unchanged"] == 0
+
+    # all dams with coordinates are in the zoom 2 tiles
+    count = 0
+    for path in summary["written"]:
+        if path.startswith("2" + os.sep):
+            with open(os.path.join(out_dir, path)) as f:
+                count += json.load(f)["count"]
+    assert count == dams_df["latitude"].notna().sum()
+
+    assert drip_tiles.export_tiles(dams_df, out_dir, zooms=[2, 6])[
+        "written"
+    ] == []
+
+    # rename Elwha and drop Mill Pond
+    changed_df = dams_df.copy()
+    changed_df.loc[changed_df["_id"] == "11", "dam_name"] = "elwha dam"
+    changed_df = changed_df[changed_df["_id"] != "12"]
+    summary = drip_tiles.export_tiles(changed_df, out_dir, zooms=[2, 6])
+
+    elwha = drip_tiles.get_quadkeys(
+        pd.Series([48.0]), pd.Series([-123.5]), 6
+    )[0]
+    mill_pond = drip_tiles.get_quadkeys(
+        pd.Series([45.2]), pd.Series([-69.1]), 6
+    )[0]
+    assert os.path.join("6", f"{elwha}.json") in summary["written"]
+    assert os.path.join("6", f"{mill_pond}.json") in summary["deleted"]
+    with open(os.path.join(out_dir, "6", f"{elwha}.json")) as f:
+        tile = json.load(f)
+    assert tile["points"][0]["dam_name"] == "elwha dam"